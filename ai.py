@@ -1,38 +1,83 @@
 import random
-from typing import TYPE_CHECKING, List
+from typing import TYPE_CHECKING, Any, Dict, Iterator
 
+import numpy as np
 import tcod
 
 from components import Component
 from game_messages import Message
 from game_types import ActionResults
+from pathfinding import PathCache
 
 if TYPE_CHECKING:
     from entity import Entity
+    from entity_list import EntityList
     from game_map import GameMap
 
 
 class AIComponent(Component):
+    __slots__ = ()
 
     def take_turn(
         self, target: 'Entity', fov_map: tcod.map.Map,
-        game_map: 'GameMap', entities: List['Entity'],
+        game_map: 'GameMap', entities: 'EntityList',
     ) -> ActionResults:
         raise NotImplementedError
 
+    def take_planned_turn(
+        self, target: 'Entity', fov_map: tcod.map.Map,
+        game_map: 'GameMap', entities: 'EntityList',
+        visible: bool, distance_squared: int,
+    ) -> ActionResults:
+        """Take a turn, given precomputed facts about the monster.
+
+        take_enemy_turns() calls this with the visibility of the monster and
+        its squared distance to the target, so subclasses don't have to look
+        them up one by one.
+        """
+        return self.take_turn(target, fov_map, game_map, entities)
+
 
 class BasicMonster(AIComponent):
+    __slots__ = ('path_cache',)
+
+    def __init__(self) -> None:
+        self.path_cache = PathCache()
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        # Saves from before path caching don't have a cache
+        state.setdefault('path_cache', PathCache())
+        super().__setstate__(state)
 
     def take_turn(
         self, target: 'Entity', fov_map: tcod.map.Map,
-        game_map: 'GameMap', entities: List['Entity'],
+        game_map: 'GameMap', entities: 'EntityList',
+    ) -> ActionResults:
+        monster = self.owner
+        dx = target.x - monster.x
+        dy = target.y - monster.y
+        return self.take_planned_turn(
+            target, fov_map, game_map, entities,
+            visible=fov_map.fov[monster.x, monster.y],
+            distance_squared=dx * dx + dy * dy)
+
+    def take_planned_turn(
+        self, target: 'Entity', fov_map: tcod.map.Map,
+        game_map: 'GameMap', entities: 'EntityList',
+        visible: bool, distance_squared: int,
     ) -> ActionResults:
         results: ActionResults = []
 
         monster = self.owner
-        if fov_map.fov[monster.x, monster.y]:
-            if monster.distance_to(target) >= 2:
-                monster.move_astar(target, entities, game_map)
+        if visible:
+            # i.e. if monster.distance_to(target) >= 2
+            if distance_squared >= 4:
+                graph = entities.path_graph
+                if graph is not None and graph.use_flow_field:
+                    monster.move_downhill(target, entities, game_map)
+                else:
+                    monster.move_astar(target, entities, game_map,
+                                       self.path_cache)
             elif target.fighter.hp > 0:
                 results.extend(monster.fighter.attack(target))
 
@@ -40,6 +85,7 @@ class BasicMonster(AIComponent):
 
 
 class ConfusedMonster(AIComponent):
+    __slots__ = ('previous_ai', 'number_of_turns')
 
     def __init__(self, previous_ai: AIComponent,
                  number_of_turns: int = 10) -> None:
@@ -48,7 +94,7 @@ class ConfusedMonster(AIComponent):
 
     def take_turn(
         self, target: 'Entity', fov_map: tcod.map.Map,
-        game_map: 'GameMap', entities: List['Entity'],
+        game_map: 'GameMap', entities: 'EntityList',
     ) -> ActionResults:
         results = []
 
@@ -69,3 +115,44 @@ class ConfusedMonster(AIComponent):
             })
 
         return results
+
+
+def take_enemy_turns(
+    target: 'Entity', fov_map: tcod.map.Map, game_map: 'GameMap',
+    entities: 'EntityList',
+) -> Iterator[ActionResults]:
+    """Let all the monsters take their turns, one by one.
+
+    Yields the results of each monster's turn, in entity list order.  Stop
+    iterating if you want the remaining monsters to skip their turns (e.g.
+    when the target dies).
+
+    Visibility and distance to the target are computed for all monsters at
+    once with NumPy.  BasicMonsters that can't see the target have nothing
+    to do, so we don't even call them.
+    """
+    monsters = list(entities.with_component('ai'))
+    if not monsters:
+        return
+
+    if entities.columns is not None:
+        rows = entities.columns.rows(monsters)
+        xs = entities.columns.x[rows]
+        ys = entities.columns.y[rows]
+    else:
+        xs = np.array([monster.x for monster in monsters])
+        ys = np.array([monster.y for monster in monsters])
+    visible = fov_map.fov[xs, ys]
+    distance_squared = (xs - target.x) ** 2 + (ys - target.y) ** 2
+    idle = ~visible & np.array([
+        isinstance(monster.ai, BasicMonster) for monster in monsters
+    ], dtype=bool)
+
+    # Nobody can change anyone else's position or visibility during the
+    # enemy turn, so the numbers we computed stay correct to the end
+    for i in np.flatnonzero(~idle).tolist():
+        monster = monsters[i]
+        yield monster.ai.take_planned_turn(
+            target, fov_map, game_map, entities,
+            visible=bool(visible[i]),
+            distance_squared=int(distance_squared[i]))
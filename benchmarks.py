@@ -0,0 +1,428 @@
+#!/usr/bin/python3
+"""Time the hot paths of the game, in repeatable, seeded scenarios.
+
+Usage: python3 benchmarks.py [--repeat N] [--output FILE] [--columnar]
+                             [name ...]
+
+Runs all the benchmarks, or just those whose names contain one of the
+given names, prints a table and writes the results as JSON (by default to
+bench-results/<date>-<time>.json), so that runs can be compared over
+time.
+
+Each benchmark is a setup function that builds what it needs and returns
+the function to time.  We call that repeatedly and report the time per
+call (and the size of what it returns, if that's bytes, e.g. a save).
+
+We run in a temporary directory, so saves and floors that get spilled to
+disk don't touch a real saved game.
+"""
+import argparse
+import json
+import os
+import pickle
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+import tcod
+import tcod.console
+
+from ai import BasicMonster, take_enemy_turns
+from data_loaders import load_game, save_game
+from death_functions import kill_monster
+from entity import Entity
+from entity_list import EntityList
+from fighter import Fighter
+from fov_functions import initialize_fov, recompute_fov
+from game_map import GameMap
+from game_messages import Message, MessageLog
+from game_states import GameStates
+from initialize_new_game import constants, get_game_variables
+from item import Item
+from item_functions import heal
+from pathfinding import PathGraph
+from render_functions import DirtyTracker, RenderOrder, render_all
+from save_format import GameData, load_from_bytes, save_to_bytes
+
+
+SEED = 42
+
+Timed = Callable[[], object]
+
+# name -> (setup function, number of calls per sample)
+BENCHMARKS: Dict[str, Tuple[Callable[[], Timed], int]] = {}
+
+
+def benchmark(name: str, number: int = 1) -> Callable[[Callable[[], Timed]],
+                                                      Callable[[], Timed]]:
+    def register(setup: Callable[[], Timed]) -> Callable[[], Timed]:
+        BENCHMARKS[name] = setup, number
+        return setup
+    return register
+
+
+def new_game() -> Tuple[Entity, EntityList, GameMap, MessageLog,
+                        GameStates]:
+    random.seed(SEED)
+    return get_game_variables()
+
+
+@benchmark('make_map', number=10)
+def bench_make_map() -> Timed:
+    player, entities, game_map, message_log, game_state = new_game()
+
+    def run() -> None:
+        # The same map every time
+        random.seed(SEED)
+        game_map.reset_tiles()
+        game_map.make_map(constants.max_rooms, constants.room_min_size,
+                          constants.room_max_size, player,
+                          EntityList([player]))
+    return run
+
+
+@benchmark('change_floor (new floor)', number=10)
+def bench_change_floor() -> Timed:
+    player, entities, game_map, message_log, game_state = new_game()
+    x, y = player.x, player.y
+
+    def run() -> None:
+        # Always the same new floor 2, from the same floor 1
+        random.seed(SEED)
+        game_map.change_floor(2, player, entities, message_log, constants)
+        # Go back to floor 1 as it was, and forget floor 2.  This is a lot
+        # quicker than making a map.
+        floor = game_map.floors.take(1)
+        game_map.set_tiles(floor.tiles)
+        game_map.dungeon_level = 1
+        entities.append(player)
+        player.place(x, y)
+    return run
+
+
+@benchmark('change_floor (back and forth)', number=100)
+def bench_revisit_floor() -> Timed:
+    player, entities, game_map, message_log, game_state = new_game()
+    entities = game_map.change_floor(2, player, entities, message_log,
+                                     constants)
+    state = {'entities': entities}
+
+    def run() -> None:
+        level = 3 - game_map.dungeon_level
+        state['entities'] = game_map.change_floor(
+            level, player, state['entities'], message_log, constants)
+    return run
+
+
+@benchmark('GameMap.set_tiles (whole map)', number=1000)
+def bench_set_tiles() -> Timed:
+    # initialize_fov() used to copy the map into a new FOV map cell by
+    # cell.  Now the map keeps its FOV map in sync, and the whole-map sync
+    # happens here, every time the player changes floors.
+    player, entities, game_map, message_log, game_state = new_game()
+    tiles = game_map.get_tiles()
+    return lambda: game_map.set_tiles(tiles)
+
+
+@benchmark('recompute_fov', number=100)
+def bench_recompute_fov() -> Timed:
+    player, entities, game_map, message_log, game_state = new_game()
+    fov_map = initialize_fov(game_map)
+    return lambda: recompute_fov(
+        fov_map, player.x, player.y, constants.fov_radius,
+        constants.fov_light_walls, constants.fov_algorithm)
+
+
+def render_setup() -> Tuple[Callable[[bool], bool], Entity, EntityList]:
+    player, entities, game_map, message_log, game_state = new_game()
+    fov_map = initialize_fov(game_map)
+    recompute_fov(fov_map, player.x, player.y, constants.fov_radius,
+                  constants.fov_light_walls, constants.fov_algorithm)
+    root_console = tcod.console.Console(
+        constants.screen_width, constants.screen_height, order='F')
+    con = tcod.console.Console(
+        constants.screen_width, constants.screen_height, order='F')
+    panel = tcod.console.Console(
+        constants.screen_width, constants.panel_height, order='F')
+    dirty = DirtyTracker()
+    entities.watchers.append(dirty)
+    mouse = tcod.event.Point(player.x, player.y)
+
+    def render(fov_recompute: bool) -> bool:
+        return render_all(
+            root_console, con, panel, entities, player, game_map, fov_map,
+            fov_recompute, message_log, constants.screen_width,
+            constants.screen_height, constants.bar_width,
+            constants.panel_height, constants.panel_y, mouse,
+            constants.colors, GameStates.PLAYERS_TURN, 0, dirty)
+
+    render(True)
+    return render, player, entities
+
+
+@benchmark('render_all (full redraw)', number=100)
+def bench_render_full() -> Timed:
+    render, player, entities = render_setup()
+    return lambda: render(True)
+
+
+@benchmark('render_all (entity moved)', number=100)
+def bench_render_move() -> Timed:
+    render, player, entities = render_setup()
+    # Wiggle an item, so only its old and new cells need redrawing (moving
+    # the player would need an FOV recompute and a full redraw)
+    item = Entity(player.x, player.y, '!', tcod.violet, 'Potion',
+                  render_order=RenderOrder.ITEM)
+    entities.append(item)
+    render(False)
+    state = {'dx': 1}
+
+    def run() -> None:
+        item.move(state['dx'], 0)
+        state['dx'] = -state['dx']
+        render(False)
+    return run
+
+
+def arena(monsters: int) -> Tuple[Entity, EntityList, GameMap,
+                                  tcod.map.Map, List[Tuple[int, int]]]:
+    """A big open room with the player in the middle and lots of orcs."""
+    random.seed(SEED)
+    game_map = GameMap(constants.map_width, constants.map_height)
+    game_map.carve([(slice(1, game_map.width - 1),
+                     slice(1, game_map.height - 1))])
+    player = Entity(game_map.width // 2, game_map.height // 2, '@',
+                    tcod.white, 'Player', blocks=True,
+                    render_order=RenderOrder.ACTOR,
+                    fighter=Fighter(hp=10 ** 9, defense=1000, power=0))
+    entities = EntityList([player], columnar=constants.columnar_entities)
+    positions: List[Tuple[int, int]] = []
+    while len(positions) < monsters:
+        x = random.randrange(1, game_map.width - 1)
+        y = random.randrange(1, game_map.height - 1)
+        if not entities.at(x, y):
+            entities.append(Entity(
+                x, y, 'o', tcod.desaturated_green, 'Orc', blocks=True,
+                render_order=RenderOrder.ACTOR,
+                fighter=Fighter(hp=20, defense=0, power=4, xp=35),
+                ai=BasicMonster()))
+            positions.append((x, y))
+    fov_map = initialize_fov(game_map)
+    # See everything, so that every monster has something to do
+    recompute_fov(fov_map, player.x, player.y, 0, True, 0)
+    return player, entities, game_map, fov_map, positions
+
+
+def enemy_turn_benchmark(monsters: int, all_at_once: bool) -> Timed:
+    player, entities, game_map, fov_map, positions = arena(monsters)
+    orcs = [entity for entity in entities if entity.ai]
+
+    def run() -> None:
+        # Put everyone back, so every turn is the same turn
+        for orc, (x, y) in zip(orcs, positions):
+            orc.place(x, y)
+        entities.path_graph = PathGraph(game_map, entities,
+                                        constants.monster_flow_field)
+        if all_at_once:
+            for results in take_enemy_turns(player, fov_map, game_map,
+                                            entities):
+                pass
+        else:
+            for orc in orcs:
+                orc.ai.take_turn(player, fov_map, game_map, entities)
+        entities.path_graph = None
+    return run
+
+
+def make_enemy_turn_benchmark(monsters: int,
+                              all_at_once: bool) -> Callable[[], Timed]:
+    def setup() -> Timed:
+        return enemy_turn_benchmark(monsters, all_at_once)
+    return setup
+
+
+for _monsters in (20, 200):
+    benchmark(f'BasicMonster.take_turn x {_monsters}')(
+        make_enemy_turn_benchmark(_monsters, False))
+    benchmark(f'take_enemy_turns x {_monsters}')(
+        make_enemy_turn_benchmark(_monsters, True))
+
+
+@benchmark('MessageLog.add_message x 1000', number=10)
+def bench_add_message() -> Timed:
+    rng = random.Random(SEED)
+    words = ['orc', 'troll', 'attacks', 'you', 'for', 'hit', 'points',
+             'the', 'is', 'dead!', 'fireball', 'explodes', 'burning']
+    messages = [
+        Message(' '.join(rng.choice(words)
+                         for n in range(rng.randint(3, 20))), tcod.white)
+        for n in range(1000)]
+
+    def run() -> None:
+        message_log = MessageLog(constants.message_x,
+                                 constants.message_width,
+                                 constants.message_height,
+                                 constants.message_history_size)
+        for message in messages:
+            message_log.add_message(message)
+    return run
+
+
+def make_game() -> GameData:
+    """A game that has been going on for a while."""
+    random.seed(SEED)
+    player, entities, game_map, message_log, game_state = (
+        get_game_variables())
+    game_map.explored[:game_map.width // 2] = True
+    for monster in list(entities.with_component('ai'))[::2]:
+        message_log.add_message(kill_monster(monster))
+    for _ in range(20):
+        player.inventory.add_item(Entity(
+            0, 0, '!', tcod.violet, 'Healing Potion',
+            render_order=RenderOrder.ITEM, item=Item(heal, amount=40)))
+    for n in range(500):
+        message_log.add_message(Message(f'The orc attacks you for {n} hit'
+                                        f' points.', tcod.white))
+    return player, entities, game_map, message_log, game_state
+
+
+@benchmark('save_game + load_game', number=10)
+def bench_save_load() -> Timed:
+    game = make_game()
+
+    def run() -> None:
+        save_game(*game)
+        load_game()
+    return run
+
+
+for _compression in ['none', 'zlib', 'lzma']:
+    def bench_save_to_bytes(compression: str = _compression) -> Timed:
+        game = make_game()
+        return lambda: save_to_bytes(*game, compression=compression)
+
+    def bench_load_from_bytes(compression: str = _compression) -> Timed:
+        data = save_to_bytes(*make_game(), compression=compression)
+        return lambda: load_from_bytes(data)
+
+    benchmark(f'save_to_bytes ({_compression})', number=10)(
+        bench_save_to_bytes)
+    benchmark(f'load_from_bytes ({_compression})', number=10)(
+        bench_load_from_bytes)
+
+
+@benchmark('pickle.dumps (old saves)', number=10)
+def bench_pickle_dumps() -> Timed:
+    # What shelve did: pickle everything, with the player as an index
+    player, entities, *rest = make_game()
+    state = (entities.index(player), entities, *rest)
+    return lambda: pickle.dumps(state)
+
+
+@benchmark('pickle.loads (old saves)', number=10)
+def bench_pickle_loads() -> Timed:
+    player, entities, *rest = make_game()
+    data = pickle.dumps((entities.index(player), entities, *rest))
+    return lambda: pickle.loads(data)
+
+
+def measure(setup: Callable[[], Timed], number: int,
+            repeat: int) -> Dict[str, Any]:
+    function = setup()
+    clock = time.perf_counter
+    samples = []
+    for n in range(repeat):
+        start = clock()
+        for i in range(number):
+            result = function()
+        samples.append((clock() - start) / number * 1000)
+    report: Dict[str, Any] = {
+        'number': number,
+        'repeat': repeat,
+        'min_ms': min(samples),
+        'median_ms': statistics.median(samples),
+        'mean_ms': statistics.mean(samples),
+        'max_ms': max(samples),
+    }
+    if isinstance(result, bytes):
+        report['bytes'] = len(result)
+    return report
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except OSError:
+        return ''
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Time the hot paths of the game.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='samples per benchmark (default: %(default)s)')
+    parser.add_argument('--output', metavar='FILE',
+                        help='where to write the JSON results')
+    parser.add_argument('--columnar', action='store_true',
+                        help='keep entities in NumPy columns')
+    parser.add_argument('names', nargs='*',
+                        help='run only benchmarks with these in their names')
+    args = parser.parse_args()
+
+    output = args.output or os.path.join(
+        'bench-results', time.strftime('%Y%m%d-%H%M%S') + '.json')
+    output = os.path.abspath(output)
+    commit = git_commit()
+    constants.columnar_entities = args.columnar
+
+    # Save synchronously, so the whole save gets timed
+    constants.background_saves = False
+
+    results = {}
+    print(f'{"benchmark":<36} {"min ms":>9} {"median ms":>9} {"bytes":>8}')
+    # Saves and floors go to the current directory, so go somewhere
+    # harmless
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='bench-') as tmpdir:
+        os.chdir(tmpdir)
+        try:
+            for name, (setup, number) in BENCHMARKS.items():
+                if args.names and not any(part in name
+                                          for part in args.names):
+                    continue
+                result = measure(setup, number, args.repeat)
+                results[name] = result
+                print(f'{name:<36} {result["min_ms"]:9.3f}'
+                      f' {result["median_ms"]:9.3f}'
+                      f' {result.get("bytes", ""):>8}')
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': commit,
+        'seed': SEED,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'tcod': tcod.__version__,
+        'platform': platform.platform(),
+        'columnar_entities': constants.columnar_entities,
+        'results': results,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results written to {output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
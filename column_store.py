@@ -0,0 +1,142 @@
+from typing import TYPE_CHECKING, Any, Callable, Iterable, List, Optional
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from entity import Entity
+    from fighter import Fighter
+
+
+class ColumnStore:
+    """Positions and fighter stats of many entities, as NumPy arrays.
+
+    Every entity in the store gets a row; its x and y live in self.x[row]
+    and self.y[row], and if it has a Fighter, the fighter's stats live in
+    self.hp[row], self.base_power[row] etc.  Entity and Fighter read and
+    write these arrays instead of their own attributes while they're in a
+    store, so the arrays are always up to date and you can do things to all
+    of them at once (e.g. burn everyone within a radius).
+
+    EntityList(columnar=True) puts its entities into a ColumnStore.
+    """
+
+    # Names of the per-row arrays, so _grow() doesn't have to repeat them
+    columns = ('x', 'y', 'fighter', 'hp', 'base_max_hp', 'base_power',
+               'base_defense', 'xp')
+
+    # Fighter attributes that move into the store
+    fighter_stats = ('hp', 'base_max_hp', 'base_power', 'base_defense', 'xp')
+
+    def __init__(self, capacity: int = 64) -> None:
+        self.entities: List[Optional['Entity']] = [None] * capacity
+        # Rows we can reuse, the lowest number last
+        self.free = list(range(capacity - 1, -1, -1))
+        self.x = np.zeros(capacity, dtype=np.int32)
+        self.y = np.zeros(capacity, dtype=np.int32)
+        # Which rows have a fighter; stats of other rows are garbage
+        self.fighter = np.zeros(capacity, dtype=bool)
+        self.hp = np.zeros(capacity, dtype=np.int32)
+        self.base_max_hp = np.zeros(capacity, dtype=np.int32)
+        self.base_power = np.zeros(capacity, dtype=np.int32)
+        self.base_defense = np.zeros(capacity, dtype=np.int32)
+        self.xp = np.zeros(capacity, dtype=np.int32)
+
+    def _grow(self) -> None:
+        capacity = len(self.entities)
+        for name in self.columns:
+            old = getattr(self, name)
+            new = np.zeros(capacity * 2, dtype=old.dtype)
+            new[:capacity] = old
+            setattr(self, name, new)
+        self.entities.extend([None] * capacity)
+        self.free.extend(range(capacity * 2 - 1, capacity - 1, -1))
+
+    def attach(self, entity: 'Entity') -> None:
+        """Move the entity's position (and fighter stats) into the store."""
+        if not self.free:
+            self._grow()
+        row = self.free.pop()
+        self.x[row] = entity.x
+        self.y[row] = entity.y
+        self.entities[row] = entity
+        entity._store = self
+        entity._row = row
+        if entity.fighter:
+            self.attach_fighter(entity.fighter, entity)
+
+    def detach(self, entity: 'Entity') -> None:
+        """Move the entity's data back into the entity."""
+        if entity.fighter:
+            self.detach_fighter(entity.fighter)
+        row = entity._row
+        x, y = entity.x, entity.y
+        entity._store = None
+        entity._x = x
+        entity._y = y
+        self.entities[row] = None
+        self.free.append(row)
+
+    def attach_fighter(self, fighter: 'Fighter', entity: 'Entity') -> None:
+        row = entity._row
+        for name in self.fighter_stats:
+            getattr(self, name)[row] = getattr(fighter, name)
+        fighter._store = self
+        fighter._row = row
+        self.fighter[row] = True
+
+    def detach_fighter(self, fighter: 'Fighter') -> None:
+        stats = [getattr(fighter, name) for name in self.fighter_stats]
+        self.fighter[fighter._row] = False
+        fighter._store = None
+        for name, value in zip(self.fighter_stats, stats):
+            setattr(fighter, name, value)
+
+    def rows(self, entities: Iterable['Entity']) -> np.ndarray:
+        """Return the rows of the given entities, as an array."""
+        return np.array([entity._row for entity in entities], dtype=np.intp)
+
+    def fighters_within(self, x: int, y: int, radius: float) -> np.ndarray:
+        """Return the rows of fighters at most radius away from (x, y)."""
+        distance_squared = (self.x - x) ** 2 + (self.y - y) ** 2
+        return np.flatnonzero(self.fighter
+                              & (distance_squared <= radius * radius))
+
+    def take_damage(self, entities: List['Entity'],
+                    amount: int) -> np.ndarray:
+        """Damage all the given fighters at once.
+
+        Returns an array of booleans telling which of them died.
+        """
+        rows = self.rows(entities)
+        self.hp[rows] -= amount
+        return self.hp[rows] <= 0
+
+
+def column(name: str,
+           on_change: Optional[Callable[[Any], None]] = None) -> property:
+    """Define an attribute that lives in a ColumnStore while in one.
+
+    The object must have _store and _row slots, and a '_' + name slot for
+    the value when it's not in a store.
+
+    on_change, if given, gets called with the object after every assignment.
+    """
+    slot = '_' + name
+
+    def getter(self: Any) -> int:
+        store = self._store
+        if store is None:
+            return getattr(self, slot)
+        return int(getattr(store, name)[self._row])
+
+    def setter(self: Any, value: int) -> None:
+        store = self._store
+        if store is None:
+            setattr(self, slot, value)
+        else:
+            getattr(store, name)[self._row] = value
+        if on_change is not None:
+            on_change(self)
+
+    getter.__name__ = setter.__name__ = name
+    return property(getter, setter)
@@ -1,10 +1,43 @@
-from typing import TYPE_CHECKING, cast
+from typing import TYPE_CHECKING, Any, Dict, Iterator, cast
 
 if TYPE_CHECKING:
     from entity import Entity
 
 
-class Component:
+class Slotted:
+    """Base class for objects that use __slots__ instead of a __dict__.
+
+    There can be thousands of entities (think corpses and items) and
+    components, and a __dict__ for each of them adds up.
+
+    Slotted objects pickle as a plain dict of attribute values, exactly like
+    objects with a __dict__ do, so saves from before we used __slots__ can
+    still be loaded.  Subclasses can override __setstate__() to upgrade old
+    state and then call the base class version.
+    """
+
+    __slots__ = ()
+
+    def _slot_names(self) -> Iterator[str]:
+        for cls in type(self).__mro__:
+            yield from cls.__dict__.get('__slots__', ())
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Unset slots are left out, like missing keys of a __dict__
+        return {
+            name: getattr(self, name)
+            for name in self._slot_names()
+            if hasattr(self, name)
+        }
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+
+
+class Component(Slotted):
+    __slots__ = ('owner',)
+
     owner: 'Entity'
 
 
@@ -12,14 +45,15 @@ def component(name: str) -> property:
     """Decorator for defining Entity component slots.
 
     All it does is update the component's owner when you assign a new component
-    to an entity.
+    to an entity, and tell the entity's EntityList about the change.  The
+    component itself is stored in the '_' + name slot, which the Entity class
+    must declare in its __slots__.
     """
+    slot = '_' + name
 
     def getter(self: 'Entity') -> Component:
-        try:
-            return cast(Component, self.__dict__[name])
-        except KeyError:
-            raise AttributeError(name)
+        # raises AttributeError if the slot was never assigned
+        return cast(Component, getattr(self, slot))
 
     def setter(self: 'Entity', value: Component) -> None:
         # it might be nice to set the owner of the old value to None, if there
@@ -28,9 +62,12 @@ def component(name: str) -> property:
         # owner
         # neither of the two cases above ever happens in the game so we can
         # ignore them for now
-        self.__dict__[name] = value
+        old_value = getattr(self, slot, None)
+        setattr(self, slot, value)
         if value is not None:
             value.owner = self  # <-- this is why @component exists
+        if self.entity_list is not None:
+            self.entity_list.component_changed(self, name, old_value, value)
 
     getter.__name__ = setter.__name__ = name
     return property(getter, setter)
@@ -1,33 +1,143 @@
 import os
 import shelve
-from typing import List, Tuple
+import threading
+from typing import Optional, Tuple
 
 from entity import Entity
+from entity_list import EntityList
 from game_map import GameMap
 from game_messages import MessageLog
 from game_states import GameStates
+from initialize_new_game import constants
+from journal import Journal
+from save_format import (
+    Snapshot, load_from_bytes, snapshot_to_bytes, take_snapshot,
+)
 
 
-def save_game(player: Entity, entities: List[Entity], game_map: GameMap,
-              message_log: MessageLog, game_state: GameStates) -> None:
-    with shelve.open('savegame.dat', 'n') as data_file:
-        data_file['player_index'] = entities.index(player)
-        data_file['entities'] = entities
-        data_file['game_map'] = game_map
-        data_file['message_log'] = message_log
-        data_file['game_state'] = game_state
+SAVE_FILE = 'savegame.sav'
 
+# Where saves used to go, before we had our own format
+LEGACY_SAVE_FILE = 'savegame.dat'
 
-def load_game() -> Tuple[Entity, List[Entity], GameMap, MessageLog,
-                         GameStates]:
-    if not os.path.isfile('savegame.dat'):
+
+class SaveThread(threading.Thread):
+    """Writes a save file in the background."""
+
+    def __init__(self, snapshot: Snapshot) -> None:
+        super().__init__(name='save_game')
+        self.snapshot = snapshot
+        self.error: Optional[Exception] = None
+
+    def run(self) -> None:
+        try:
+            write_save(self.snapshot)
+        except Exception as e:
+            # wait_for_saves() will raise it in the main thread
+            self.error = e
+
+
+# The save that's being written right now, if any
+save_thread: Optional[SaveThread] = None
+
+
+def save_game(player: Entity, entities: EntityList, game_map: GameMap,
+              message_log: MessageLog, game_state: GameStates,
+              journal: Optional[Journal] = None) -> None:
+    """Save the game.
+
+    Only taking a snapshot of the game happens right away; the rest
+    happens in a background thread, if constants.background_saves is on.
+    Call wait_for_saves() before exiting!
+
+    If you pass the journal, the save remembers how far it got, and the
+    journal starts a new file.
+    """
+    global save_thread
+    # One at a time, so an older save can't overwrite a newer one
+    wait_for_saves()
+    # The save has the newest messages, the spill file the older ones
+    message_log.flush()
+    snapshot = take_snapshot(player, entities, game_map, message_log,
+                             game_state, journal)
+    if journal is not None:
+        # The previous save is safely on disk now, so we don't need the
+        # journal from before it
+        journal.prune()
+        journal.saved()
+    if constants.background_saves:
+        save_thread = SaveThread(snapshot)
+        save_thread.start()
+    else:
+        write_save(snapshot)
+
+
+def write_save(snapshot: Snapshot) -> None:
+    data = snapshot_to_bytes(snapshot, constants.save_compression)
+    # Write a new file and then rename it, so that if we crash halfway,
+    # the previous save is still there
+    temp_file = SAVE_FILE + '.tmp'
+    with open(temp_file, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, SAVE_FILE)
+
+
+def wait_for_saves() -> None:
+    """Wait until the save file is completely written."""
+    global save_thread
+    if save_thread is not None:
+        thread = save_thread
+        save_thread = None
+        thread.join()
+        if thread.error is not None:
+            raise thread.error
+
+
+def load_game() -> Tuple[Entity, EntityList, GameMap, MessageLog,
+                         GameStates, Journal]:
+    """Load the saved game.
+
+    If the game went on after it was saved (e.g. it crashed before the
+    next checkpoint), the returned journal has the actions the player took
+    since then, ready to be replayed.
+    """
+    wait_for_saves()
+    journal: Optional[Journal]
+    if not os.path.isfile(SAVE_FILE):
+        # The next save_game() will convert it to the new format
+        game = load_legacy_game()
+        journal = None
+    else:
+        with open(SAVE_FILE, 'rb') as f:
+            data = f.read()
+        game, journal = load_from_bytes(data)
+
+    if journal is None:
+        # Whatever journal files there are, they don't go with this save
+        Journal.clear()
+        journal = Journal()
+    else:
+        journal.recover()
+        journal.prune()
+    return game + (journal,)
+
+
+def load_legacy_game() -> Tuple[Entity, EntityList, GameMap, MessageLog,
+                                GameStates]:
+    """Load a game saved with shelve by older versions."""
+    if not os.path.isfile(LEGACY_SAVE_FILE):
         raise FileNotFoundError
 
-    with shelve.open('savegame.dat', 'r') as data_file:
+    with shelve.open(LEGACY_SAVE_FILE, 'r') as data_file:
         player_index = data_file['player_index']
         entities = data_file['entities']
         game_map = data_file['game_map']
         message_log = data_file['message_log']
         game_state = data_file['game_state']
+    if isinstance(entities, list):
+        # saved before we had EntityList
+        entities = EntityList(entities)
     player = entities[player_index]
     return player, entities, game_map, message_log, game_state
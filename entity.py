@@ -1,13 +1,16 @@
 import math
-from typing import List, Optional, TYPE_CHECKING
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
 
 import tcod
 
-from components import component
+from components import Slotted, component
 from item import Item
+from pathfinding import MAX_PATH_LENGTH, PathCache, PathGraph
 from render_functions import RenderOrder
 
 if TYPE_CHECKING:  # noqa: F401
+    from column_store import ColumnStore
+    from entity_list import EntityList
     from game_map import GameMap
     from ai import AIComponent
     from equipment import Equipment
@@ -18,9 +21,19 @@ if TYPE_CHECKING:  # noqa: F401
     from stairs import Stairs
 
 
-class Entity:
+class Entity(Slotted):
     """A generic object to represent players, enemies, items etc."""
 
+    # Component slots are named after the components with a leading '_',
+    # see component()
+    COMPONENTS = ('fighter', 'ai', 'item', 'inventory', 'stairs', 'level',
+                  'equipment', 'equippable')
+
+    __slots__ = (
+        'entity_list', '_store', '_row', '_x', '_y', 'char', 'color', 'name',
+        'blocks', '_render_order',
+    ) + tuple('_' + name for name in COMPONENTS)
+
     fighter = component('fighter')
     ai = component('ai')
     item = component('item')
@@ -41,13 +54,19 @@ class Entity:
                  level: Optional['Level'] = None,
                  equipment: Optional['Equipment'] = None,
                  equippable: Optional['Equippable'] = None):
-        self.x = x
-        self.y = y
+        # The EntityList we're in, if any; EntityList.append() sets this
+        self.entity_list: Optional['EntityList'] = None
+        # The ColumnStore that holds our position while we're in a columnar
+        # EntityList, and our row in it; ColumnStore.attach() sets these
+        self._store: Optional['ColumnStore'] = None
+        self._row = -1
+        self._x = x
+        self._y = y
         self.char = char
         self.color = color
         self.name = name
         self.blocks = blocks
-        self.render_order = render_order
+        self._render_order = render_order
 
         # Components
         self.fighter = fighter
@@ -62,13 +81,73 @@ class Entity:
         if self.equippable and not self.item:
             self.item = Item()
 
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        # Saves from before EntityList have plain x and y attributes
+        if 'x' in state:
+            state['_x'] = state.pop('x')
+            state['_y'] = state.pop('y')
+        if 'render_order' in state:
+            state['_render_order'] = state.pop('render_order')
+        # Saves from before __slots__ store components under their own names
+        for name in self.COMPONENTS:
+            if name in state:
+                state['_' + name] = state.pop(name)
+        state.setdefault('entity_list', None)
+        state.setdefault('_store', None)
+        state.setdefault('_row', -1)
+        super().__setstate__(state)
+
+    @property
+    def x(self) -> int:
+        if self._store is None:
+            return self._x
+        return int(self._store.x[self._row])
+
+    @x.setter
+    def x(self, value: int) -> None:
+        self.place(value, self.y)
+
+    @property
+    def y(self) -> int:
+        if self._store is None:
+            return self._y
+        return int(self._store.y[self._row])
+
+    @y.setter
+    def y(self, value: int) -> None:
+        self.place(self.x, value)
+
+    @property
+    def render_order(self) -> RenderOrder:
+        return self._render_order
+
+    @render_order.setter
+    def render_order(self, value: RenderOrder) -> None:
+        old_render_order = self._render_order
+        self._render_order = value
+        if self.entity_list is not None and value != old_render_order:
+            # keep the drawing layers up to date
+            self.entity_list.render_order_changed(self, old_render_order)
+
+    def place(self, x: int, y: int) -> None:
+        """Put the entity at the given coordinates."""
+        old_x, old_y = self.x, self.y
+        if self._store is None:
+            self._x = x
+            self._y = y
+        else:
+            self._store.x[self._row] = x
+            self._store.y[self._row] = y
+        if self.entity_list is not None and (x, y) != (old_x, old_y):
+            # keep the spatial index up to date
+            self.entity_list.moved(self, old_x, old_y)
+
     def move(self, dx: int, dy: int) -> None:
         """Move the entity by a given amount."""
-        self.x += dx
-        self.y += dy
+        self.place(self.x + dx, self.y + dy)
 
     def move_towards(self, target_x: int, target_y: int, game_map: 'GameMap',
-                     entities: List['Entity']) -> None:
+                     entities: 'EntityList') -> None:
         dx = target_x - self.x
         dy = target_y - self.y
         distance = math.hypot(dx, dy)
@@ -80,52 +159,30 @@ class Entity:
                     entities, self.x + dx, self.y + dy)):
             self.move(dx, dy)
 
-    def move_astar(self, target: 'Entity', entities: List['Entity'],
-                   game_map: 'GameMap') -> None:
-        # Create a FOV map that has the dimensions of the map
-        fov = tcod.map.Map(game_map.width, game_map.height, order='F')
-
-        # Scan the current map each turn and set all the walls as unwalkable
-        for y in range(game_map.height):
-            for x in range(game_map.width):
-                fov.transparent[x, y] = not game_map.tiles[x][y].block_sight
-                fov.walkable[x, y] = not game_map.tiles[x][y].blocked
-
-        # Scan all the objects to see if there are objects that must be
-        # navigated around
-        # Check also that the object isn't self or the target (so that the
-        # start and the end points are free)
-        # The AI class handles the situation if self is next to the target so
-        # it will not use this A* function anyway
-        for entity in entities:
-            if entity.blocks and entity != self and entity != target:
-                # Set the tile as a wall so it must be navigated around
-                fov.walkable[entity.x, entity.y] = False
-
-        # Allocate a A* path
-        # The 1.41 is the normal diagonal cost of moving, it can be set as 0.0
-        # if diagonal moves are prohibited
-        my_path = tcod.path_new_using_map(fov, 1.41)
-
-        # Compute the path between self's coordinates and the target's
-        # coordinates
-        tcod.path_compute(my_path, self.x, self.y, target.x, target.y)
+    def move_astar(self, target: 'Entity', entities: 'EntityList',
+                   game_map: 'GameMap',
+                   path_cache: Optional[PathCache] = None) -> None:
+        # If we computed a path last turn and it's still good, follow it
+        path = None
+        if path_cache is not None:
+            path = path_cache.lookup(self, target, entities, game_map)
+        if path is None:
+            path = self.find_path(target, entities, game_map)
 
         # Check if the path exists, and in this case, also the path is shorter
-        # than 25 tiles
+        # than 25 tiles (MAX_PATH_LENGTH)
         # The path size matters if you want the monster to use alternative
         # longer paths (for example through other rooms) if for example the
         # player is in a corridor
         # It makes sense to keep path size relatively low to keep the monsters
         # from running around the map if there's an alternative path really far
         # away
-        if not tcod.path_is_empty(my_path) and tcod.path_size(my_path) < 25:
-            # Find the next coordinates in the computed full path
-            next_x, next_y = tcod.path_walk(my_path, True)
-            if next_x is not None and next_y is not None:
-                # Set self's coordinates to the next path tile
-                self.x = next_x
-                self.y = next_y
+        if path and len(path) < MAX_PATH_LENGTH:
+            # Set self's coordinates to the next path tile
+            next_x, next_y = path[0]
+            self.place(next_x, next_y)
+            if path_cache is not None:
+                path_cache.store(self, path[1:], game_map)
         else:
             # Keep the old move function as a backup so that if there are no
             # paths (for example another monster blocks a corridor) it will
@@ -133,6 +190,41 @@ class Entity:
             # opening)
             self.move_towards(target.x, target.y, game_map, entities)
 
+    def find_path(self, target: 'Entity', entities: 'EntityList',
+                  game_map: 'GameMap') -> List[Tuple[int, int]]:
+        # All the monsters share one graph of walls and blocking entities
+        # during an enemy turn.  If we're called at some other time, build a
+        # graph just for us.
+        graph = entities.path_graph
+        if graph is None:
+            graph = PathGraph(game_map, entities)
+
+        # Compute the path between self's coordinates and the target's
+        # coordinates.  Self and the target are not obstacles, so that the
+        # start and the end points are free.
+        # The AI class handles the situation if self is next to the target so
+        # it will not use this A* function anyway
+        return graph.find_path(self.x, self.y, target.x, target.y)
+
+    def move_downhill(self, target: 'Entity', entities: 'EntityList',
+                      game_map: 'GameMap') -> None:
+        """Like move_astar(), but follow the shared flow field to the target.
+
+        There's no path search here, just a look at the 8 neighbouring
+        tiles, because PathGraph computes the flow field once per target.
+        """
+        graph = entities.path_graph
+        if graph is None:
+            graph = PathGraph(game_map, entities, use_flow_field=True)
+
+        step = graph.flow_step(self.x, self.y, target.x, target.y,
+                               MAX_PATH_LENGTH)
+        if step is not None:
+            self.place(*step)
+        else:
+            # Same backup plan as in move_astar()
+            self.move_towards(target.x, target.y, game_map, entities)
+
     def distance(self, x: int, y: int) -> float:
         return math.hypot(self.x - x, self.y - y)
 
@@ -142,10 +234,6 @@ class Entity:
         return math.hypot(dx, dy)
 
 
-def get_blocking_entities_at_location(entities: List[Entity],
+def get_blocking_entities_at_location(entities: 'EntityList',
                                       x: int, y: int) -> Optional[Entity]:
-    for entity in entities:
-        if entity.blocks and entity.x == x and entity.y == y:
-            return entity
-
-    return None
+    return entities.blocking_at(x, y)
@@ -0,0 +1,291 @@
+from operator import attrgetter
+from typing import (
+    TYPE_CHECKING, Any, Callable, Collection, Dict, Iterable, Iterator, List,
+    Optional, Sequence, Tuple, cast,
+)
+
+from column_store import ColumnStore
+from render_functions import RenderOrder
+
+if TYPE_CHECKING:
+    from entity import Entity
+    from pathfinding import PathGraph
+
+
+class EntityList:
+    """All the entities on a floor, indexed by position.
+
+    It behaves mostly like a list: you can iterate over it, append() and
+    remove() entities, and get their len().  It also knows what's where, so
+    "what is at (x, y)" is a dict lookup instead of a scan over everything.
+
+    Entities tell their EntityList whenever they move, so the index stays
+    up to date.  Don't add or remove entities while iterating.
+
+    With columnar=True the positions and fighter stats of all the entities
+    are kept in a ColumnStore, which makes some things (like fireballs)
+    faster when there are lots of entities.
+    """
+
+    def __init__(self, entities: Iterable['Entity'] = (),
+                 columnar: bool = False) -> None:
+        # Dicts remember insertion order, so this is our "list", but one
+        # where removal doesn't have to scan everything.  The values are
+        # sequence numbers that we use to keep each tile's entities in the
+        # same order as they appear in the list.
+        self.order: Dict['Entity', int] = {}
+        self.next_number = 0
+        self.by_position: Dict[Tuple[int, int], List['Entity']] = {}
+        # Entities grouped by RenderOrder, in drawing order, so we don't have
+        # to sort them on every frame.  Inner dicts are used as ordered sets.
+        self.layers: Dict[RenderOrder, Dict['Entity', None]] = {
+            render_order: {}
+            for render_order in sorted(RenderOrder, key=attrgetter('value'))
+        }
+        # Entities that have a component, by component name, in list order,
+        # so that e.g. the enemy turn doesn't have to look at every corpse
+        self.by_component: Dict[str, Dict['Entity', None]] = {}
+        # The monsters' shared pathfinding graph, during enemy turns
+        self.path_graph: Optional['PathGraph'] = None
+        # Anything else that wants to know when entities move, e.g. the
+        # renderer's DirtyTracker; must have an entity_moved() method like
+        # PathGraph's
+        self.watchers: List[Any] = []
+        self.columns: Optional[ColumnStore] = None
+        if columnar:
+            self.columns = ColumnStore()
+        for entity in entities:
+            self.append(entity)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state['path_graph'] = None
+        state['watchers'] = []
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        # Saves from before ColumnStore
+        self.__dict__.setdefault('columns', None)
+        if 'layers' not in state:
+            # Saves from before render layers
+            self.layers = {
+                render_order: {}
+                for render_order in sorted(RenderOrder,
+                                           key=attrgetter('value'))
+            }
+            for entity in self.order:
+                self.layers[entity.render_order][entity] = None
+        if 'by_component' not in state:
+            # Saves from before the component index
+            self.by_component = {}
+            for entity in self.order:
+                self._add_to_components(entity)
+
+    def __iter__(self) -> Iterator['Entity']:
+        return iter(self.order)
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def __contains__(self, entity: object) -> bool:
+        return entity in self.order
+
+    def __getitem__(self, index: int) -> 'Entity':
+        return list(self.order)[index]
+
+    def index(self, entity: 'Entity') -> int:
+        return list(self.order).index(entity)
+
+    def append(self, entity: 'Entity') -> None:
+        if entity.entity_list is not None:
+            entity.entity_list.remove(entity)
+        self.order[entity] = self.next_number
+        self.next_number += 1
+        entity.entity_list = self
+        if self.columns is not None:
+            self.columns.attach(entity)
+        self._add_to_tile(entity, entity.x, entity.y)
+        self.layers[entity.render_order][entity] = None
+        self._add_to_components(entity)
+
+    def remove(self, entity: 'Entity') -> None:
+        if entity not in self.order:
+            raise ValueError(f'{entity.name} is not in this EntityList')
+        self._remove_from_tile(entity, entity.x, entity.y)
+        del self.layers[entity.render_order][entity]
+        for members in self.by_component.values():
+            members.pop(entity, None)
+        del self.order[entity]
+        if self.columns is not None:
+            self.columns.detach(entity)
+        entity.entity_list = None
+
+    def moved(self, entity: 'Entity', old_x: int, old_y: int) -> None:
+        """Update the index after an entity moves from (old_x, old_y).
+
+        Entity calls this for you.
+        """
+        self._remove_from_tile(entity, old_x, old_y)
+        self._add_to_tile(entity, entity.x, entity.y)
+        if self.path_graph is not None:
+            self.path_graph.entity_moved(entity, old_x, old_y)
+        for watcher in self.watchers:
+            watcher.entity_moved(entity, old_x, old_y)
+
+    def render_order_changed(self, entity: 'Entity',
+                             old_render_order: RenderOrder) -> None:
+        """Move an entity to a different layer.
+
+        Entity calls this for you.
+        """
+        del self.layers[old_render_order][entity]
+        self.layers[entity.render_order][entity] = None
+
+    def in_render_order(self) -> Iterator['Entity']:
+        """Iterate over all entities in the order they should be drawn."""
+        for layer in self.layers.values():
+            yield from layer
+
+    def component_changed(self, entity: 'Entity', name: str,
+                          old_component: Any, new_component: Any) -> None:
+        """Update the index after an entity gets a new component.
+
+        Entity calls this for you.
+        """
+        if old_component is None and new_component is not None:
+            members = self.by_component.setdefault(name, {})
+            members[entity] = None
+            if self.order[entity] != self.next_number - 1:
+                # Entities usually get their components before they're added
+                # to the list; if not, we have to restore the list order
+                self.by_component[name] = dict.fromkeys(
+                    sorted(members, key=self.order.__getitem__))
+        elif old_component is not None and new_component is None:
+            del self.by_component[name][entity]
+        if self.columns is not None and name == 'fighter':
+            if old_component is not None:
+                self.columns.detach_fighter(old_component)
+            if new_component is not None:
+                self.columns.attach_fighter(new_component, entity)
+
+    def with_component(self, name: str) -> Collection['Entity']:
+        """Return all the entities that have the named component.
+
+        They come in list order.  Do not modify the returned collection, and
+        make a copy if you're going to add or remove entities or their
+        components while iterating.
+        """
+        return self.by_component.get(name, {}).keys()
+
+    def at(self, x: int, y: int) -> Sequence['Entity']:
+        """Return all the entities at (x, y), in list order.
+
+        Do not modify the returned sequence!
+        """
+        return self.by_position.get((x, y), ())
+
+    def blocking_at(self, x: int, y: int) -> Optional['Entity']:
+        for entity in self.at(x, y):
+            if entity.blocks:
+                return entity
+        return None
+
+    def within(
+        self, x: int, y: int, radius: float,
+        condition: Optional[Callable[['Entity'], Any]] = None,
+    ) -> List['Entity']:
+        """Return all entities at most radius away from (x, y), in list order.
+
+        If you pass a condition, only entities for which it returns a true
+        value are included.
+        """
+        found = [
+            entity
+            for distance_squared, entity in self._near(x, y, radius)
+            if condition is None or condition(entity)
+        ]
+        found.sort(key=self.order.__getitem__)
+        return found
+
+    def fighters_within(self, x: int, y: int,
+                        radius: float) -> List['Entity']:
+        """Return all fighters at most radius away from (x, y), in list order.
+
+        Same as within(x, y, radius, attrgetter('fighter')), but vectorized
+        if we have a ColumnStore.
+        """
+        if self.columns is None:
+            return self.within(x, y, radius, attrgetter('fighter'))
+        entities = self.columns.entities
+        found = [
+            cast('Entity', entities[row])
+            for row in self.columns.fighters_within(x, y, radius).tolist()
+        ]
+        found.sort(key=self.order.__getitem__)
+        return found
+
+    def nearest(
+        self, x: int, y: int, max_distance: float,
+        condition: Optional[Callable[['Entity'], Any]] = None,
+    ) -> Optional['Entity']:
+        """Return the entity closest to (x, y), but closer than max_distance.
+
+        If you pass a condition, only entities for which it returns a true
+        value are considered.  If several are equally close, the one that
+        comes first in the list wins.
+        """
+        best = None
+        best_key = (max_distance * max_distance, -1)
+        for distance_squared, entity in self._near(x, y, max_distance):
+            key = (distance_squared, self.order[entity])
+            if key < best_key and (condition is None or condition(entity)):
+                best = entity
+                best_key = key
+        return best
+
+    def _near(self, x: int, y: int,
+              radius: float) -> Iterator[Tuple[int, 'Entity']]:
+        """Yield (squared distance, entity) for everyone within radius."""
+        limit = radius * radius
+        r = int(radius)
+        if (2 * r + 1) ** 2 <= len(self.by_position):
+            # Look at the tiles around (x, y)
+            for tx in range(x - r, x + r + 1):
+                for ty in range(y - r, y + r + 1):
+                    here = self.by_position.get((tx, ty))
+                    if here:
+                        distance_squared = (tx - x) ** 2 + (ty - y) ** 2
+                        if distance_squared <= limit:
+                            for entity in here:
+                                yield distance_squared, entity
+        else:
+            # There are fewer occupied tiles than tiles around (x, y), so
+            # look at the occupied ones instead
+            for (tx, ty), here in self.by_position.items():
+                distance_squared = (tx - x) ** 2 + (ty - y) ** 2
+                if distance_squared <= limit:
+                    for entity in here:
+                        yield distance_squared, entity
+
+    def _add_to_components(self, entity: 'Entity') -> None:
+        # Only call this for the last entity in the list
+        for name in entity.COMPONENTS:
+            if getattr(entity, name) is not None:
+                self.by_component.setdefault(name, {})[entity] = None
+
+    def _add_to_tile(self, entity: 'Entity', x: int, y: int) -> None:
+        here = self.by_position.setdefault((x, y), [])
+        # There are rarely more than two or three entities on the same tile,
+        # so a linear search is fine
+        number = self.order[entity]
+        pos = len(here)
+        while pos > 0 and self.order[here[pos - 1]] > number:
+            pos -= 1
+        here.insert(pos, entity)
+
+    def _remove_from_tile(self, entity: 'Entity', x: int, y: int) -> None:
+        here = self.by_position[x, y]
+        here.remove(entity)
+        if not here:
+            del self.by_position[x, y]
@@ -1,14 +1,28 @@
-from typing import Dict, Iterable, Optional
+from typing import Any, Dict, Iterable, Optional
 
+from components import Component
 from entity import Entity
 from equipment_slots import EquipmentSlots
 from game_types import ActionResults
 
 
-class Equipment:
+class Equipment(Component):
+    __slots__ = ('slots', 'equipped')
 
     def __init__(self) -> None:
         self.slots: Dict[EquipmentSlots, Optional[Entity]] = {}
+        # The same thing the other way around, for quick lookups
+        self.equipped: Dict[Entity, EquipmentSlots] = {}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        # Saves from before we had the equipped mapping
+        if 'equipped' not in state:
+            state['equipped'] = {
+                item: slot
+                for slot, item in state['slots'].items()
+                if item is not None
+            }
+        super().__setstate__(state)
 
     @property
     def main_hand(self) -> Optional[Entity]:
@@ -48,13 +62,10 @@ class Equipment:
         )
 
     def is_equipped(self, item: Entity) -> bool:
-        return item in self.equipped_slots
+        return item in self.equipped
 
     def where_equipped(self, item: Entity) -> Optional[EquipmentSlots]:
-        for slot, equiped_item in self.slots.items():
-            if equiped_item == item:
-                return slot
-        return None
+        return self.equipped.get(item)
 
     def toggle_equip(self, equippable_entity: Entity) -> ActionResults:
         results: ActionResults = []
@@ -62,17 +73,25 @@ class Equipment:
         slot = equippable_entity.equippable.slot
         if equippable_entity == self.slots.get(slot):
             self.slots[slot] = None
+            del self.equipped[equippable_entity]
             results.append({
                 'dequipped': equippable_entity,
             })
         else:
-            if self.slots.get(slot):
+            old_entity = self.slots.get(slot)
+            if old_entity:
+                del self.equipped[old_entity]
                 results.append({
-                    'dequipped': self.slots[slot],
+                    'dequipped': old_entity,
                 })
             self.slots[slot] = equippable_entity
+            self.equipped[equippable_entity] = slot
             results.append({
                 'equipped': equippable_entity,
             })
 
+        if self.owner.fighter:
+            # Our bonuses changed
+            self.owner.fighter.invalidate_stats()
+
         return results
@@ -1,7 +1,9 @@
+from components import Component
 from equipment_slots import EquipmentSlots
 
 
-class Equippable:
+class Equippable(Component):
+    __slots__ = ('slot', 'power_bonus', 'defense_bonus', 'max_hp_bonus')
 
     def __init__(self, slot: EquipmentSlots, power_bonus: int = 0,
                  defense_bonus: int = 0, max_hp_bonus: int = 0):
@@ -1,5 +1,8 @@
+from typing import Any, Dict, Optional, Tuple
+
 import tcod
 
+from column_store import ColumnStore, column
 from components import Component
 from entity import Entity
 from game_messages import Message
@@ -7,33 +10,75 @@ from game_types import ActionResults
 
 
 class Fighter(Component):
+    __slots__ = ('_store', '_row', '_base_max_hp', '_hp', '_base_defense',
+                 '_base_power', '_xp', '_derived')
+
+    # These live in the ColumnStore of the owner's EntityList, if it has one
+    base_max_hp = column(
+        'base_max_hp', on_change=lambda self: self.invalidate_stats())
+    hp = column('hp')
+    base_defense = column(
+        'base_defense', on_change=lambda self: self.invalidate_stats())
+    base_power = column(
+        'base_power', on_change=lambda self: self.invalidate_stats())
+    xp = column('xp')
 
     def __init__(self, hp: int, defense: int, power: int, xp: int = 0):
+        self._store: Optional[ColumnStore] = None
+        self._row = -1
+        # max_hp, power and defense, see derived_stats()
+        self._derived: Optional[Tuple[int, int, int]] = None
         self.base_max_hp = self.hp = hp
         self.base_defense = defense
         self.base_power = power
         self.xp = xp
 
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        # Saves from before ColumnStore have the stats under their own names
+        for name in ColumnStore.fighter_stats:
+            if name in state:
+                state['_' + name] = state.pop(name)
+        state.setdefault('_store', None)
+        state.setdefault('_row', -1)
+        state.setdefault('_derived', None)
+        super().__setstate__(state)
+
+    def derived_stats(self) -> Tuple[int, int, int]:
+        """Return max_hp, power and defense, including equipment bonuses.
+
+        These get read all the time (every attack, every frame of the
+        character screen), so we remember them until invalidate_stats().
+        """
+        if self._derived is None:
+            max_hp = self.base_max_hp
+            power = self.base_power
+            defense = self.base_defense
+            if self.owner and self.owner.equipment:
+                max_hp += self.owner.equipment.max_hp_bonus
+                power += self.owner.equipment.power_bonus
+                defense += self.owner.equipment.defense_bonus
+            self._derived = (max_hp, power, defense)
+        return self._derived
+
+    def invalidate_stats(self) -> None:
+        """Forget the cached max_hp, power and defense.
+
+        Call this when equipment changes.  Changing the base stats calls
+        it for you.
+        """
+        self._derived = None
+
     @property
     def max_hp(self) -> int:
-        bonus = 0
-        if self.owner and self.owner.equipment:
-            bonus += self.owner.equipment.max_hp_bonus
-        return self.base_max_hp + bonus
+        return self.derived_stats()[0]
 
     @property
     def power(self) -> int:
-        bonus = 0
-        if self.owner and self.owner.equipment:
-            bonus += self.owner.equipment.power_bonus
-        return self.base_power + bonus
+        return self.derived_stats()[1]
 
     @property
     def defense(self) -> int:
-        bonus = 0
-        if self.owner and self.owner.equipment:
-            bonus += self.owner.equipment.defense_bonus
-        return self.base_defense + bonus
+        return self.derived_stats()[2]
 
     def take_damage(self, amount: int) -> ActionResults:
         results = []
@@ -0,0 +1,129 @@
+import os
+import pickle
+from collections import OrderedDict
+from typing import (
+    TYPE_CHECKING, Any, Dict, Iterator, List, NamedTuple, Set, Tuple,
+)
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from entity_list import EntityList
+
+
+FLOORS_DIRECTORY = 'savegame.floors'
+
+
+class Floor(NamedTuple):
+    """A floor the player isn't on right now."""
+    entities: 'EntityList'
+    # blocked, block_sight and explored, stacked (see GameMap.get_tiles())
+    tiles: np.ndarray
+
+
+class FloorStore:
+    """The floors the player has left, keyed by dungeon level.
+
+    The most recently left ones stay in memory, as they are.  Older ones
+    get written to files in FLOORS_DIRECTORY: a pickle of the entities and
+    an .npy file of the tiles, which we memory-map when we read it back.
+
+    These files are only a cache for while the game is running: save files
+    have all the floors in them (see save_format).  A floor can't change
+    while the player is elsewhere, so save_format keeps what it made of
+    each floor in self.snapshots, and only has to look at a floor again
+    after the player has been back there.  Saving doesn't need to read the
+    floors on disk again.
+    """
+
+    def __init__(self, cache_size: int = 3,
+                 directory: str = FLOORS_DIRECTORY) -> None:
+        self.cache_size = cache_size
+        self.directory = directory
+        # Least recently left first
+        self.in_memory: 'OrderedDict[int, Floor]' = OrderedDict()
+        self.on_disk: Set[int] = set()
+        # The document and packed tiles of each floor, for save_format
+        self.snapshots: Dict[int, Tuple[Dict[str, Any], bytes]] = {}
+
+    def __contains__(self, level: int) -> bool:
+        return level in self.in_memory or level in self.on_disk
+
+    def __len__(self) -> int:
+        return len(self.in_memory) + len(self.on_disk)
+
+    def put(self, level: int, floor: Floor) -> None:
+        self.on_disk.discard(level)
+        self.snapshots.pop(level, None)
+        self.in_memory[level] = floor
+        self.in_memory.move_to_end(level)
+        while len(self.in_memory) > self.cache_size:
+            old_level, old_floor = self.in_memory.popitem(last=False)
+            self.write(old_level, old_floor)
+
+    def take(self, level: int) -> Floor:
+        """Remove a floor from the store and return it."""
+        # The player is going back there, so it will change
+        self.snapshots.pop(level, None)
+        if level in self.in_memory:
+            return self.in_memory.pop(level)
+        floor = self.read(level)
+        self.on_disk.remove(level)
+        return floor
+
+    def levels(self) -> List[int]:
+        return sorted(self.in_memory.keys() | self.on_disk)
+
+    def get(self, level: int) -> Floor:
+        """Return a floor, reading it from disk if needed.
+
+        The floor stays in the store (and on disk, if it was there).
+        """
+        if level in self.in_memory:
+            return self.in_memory[level]
+        return self.read(level)
+
+    def items(self) -> Iterator[Tuple[int, Floor]]:
+        """Return all the floors, reading the ones on disk as needed."""
+        for level in self.levels():
+            yield level, self.get(level)
+
+    def clear(self) -> None:
+        """Forget all the floors, and delete their files.
+
+        Call this when starting a new game, so no floors of the previous
+        one stay around.
+        """
+        self.in_memory.clear()
+        self.on_disk.clear()
+        self.snapshots.clear()
+        try:
+            filenames = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for filename in filenames:
+            os.unlink(os.path.join(self.directory, filename))
+
+    def filename(self, level: int, ext: str) -> str:
+        return os.path.join(self.directory, f'{level}.{ext}')
+
+    def write(self, level: int, floor: Floor) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        # Write new files and then rename them, so we never overwrite a file
+        # that's still memory-mapped
+        entities_file = self.filename(level, 'entities')
+        with open(entities_file + '.tmp', 'wb') as f:
+            pickle.dump(floor.entities, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(entities_file + '.tmp', entities_file)
+        tiles_file = self.filename(level, 'npy')
+        with open(tiles_file + '.tmp', 'wb') as f:
+            np.save(f, floor.tiles)
+        os.replace(tiles_file + '.tmp', tiles_file)
+        self.on_disk.add(level)
+
+    def read(self, level: int) -> Floor:
+        with open(self.filename(level, 'entities'), 'rb') as f:
+            entities = pickle.load(f)
+        # Pages of the file get read only when the tiles are looked at
+        tiles = np.load(self.filename(level, 'npy'), mmap_mode='r')
+        return Floor(entities, tiles)
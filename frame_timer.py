@@ -0,0 +1,116 @@
+import json
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+
+# The phases of a frame, in the order they happen in play_game()
+PHASES = ['save', 'input', 'fov', 'render', 'flush', 'player', 'enemies']
+
+
+def percentile(sorted_samples: List[float], fraction: float) -> float:
+    index = min(int(len(sorted_samples) * fraction), len(sorted_samples) - 1)
+    return sorted_samples[index]
+
+
+class PhaseStats:
+    """How long one phase took, over the last few frames and overall."""
+
+    def __init__(self, window: int) -> None:
+        self.recent: Deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.recent.append(seconds)
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def summary(self) -> Dict[str, Any]:
+        """Return the p50/p95/max of the recent samples, in milliseconds."""
+        samples = sorted(self.recent)
+        if not samples:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'p50_ms': percentile(samples, 0.5) * 1000,
+            'p95_ms': percentile(samples, 0.95) * 1000,
+            'max_ms': samples[-1] * 1000,
+            'mean_ms': self.total / self.count * 1000,
+            'max_ever_ms': self.max * 1000,
+        }
+
+
+class FrameTimer:
+    """Times the phases of each frame of the game loop.
+
+    Call start_frame() at the start of each frame, and lap(phase) at the end
+    of each phase; the time since the previous lap (or the start of the
+    frame) counts towards that phase.  Phases you skip in a frame just don't
+    get a sample.
+
+    We keep the last `window` samples of each phase, for a rolling p50/p95/
+    max, plus a few totals for the whole game.
+    """
+
+    enabled = True
+
+    def __init__(self, window: int = 1000,
+                 show_overlay: bool = False) -> None:
+        # Show the timings on screen (see render_frame_times())
+        self.show_overlay = show_overlay
+        self.clock = time.perf_counter
+        self.phases = {phase: PhaseStats(window)
+                       for phase in PHASES + ['frame']}
+        self.frame_start: Optional[float] = None
+        self.last_lap = 0.0
+
+    def start_frame(self) -> None:
+        now = self.clock()
+        if self.frame_start is not None:
+            self.phases['frame'].add(now - self.frame_start)
+        self.frame_start = self.last_lap = now
+
+    def end_frame(self) -> None:
+        """Count the last frame, when there won't be another one after it."""
+        if self.frame_start is not None:
+            self.phases['frame'].add(self.clock() - self.frame_start)
+            self.frame_start = None
+
+    def lap(self, phase: str) -> None:
+        now = self.clock()
+        self.phases[phase].add(now - self.last_lap)
+        self.last_lap = now
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        return {phase: stats.summary()
+                for phase, stats in self.phases.items()}
+
+    def dump(self, filename: str) -> None:
+        with open(filename, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+            f.write('\n')
+
+
+class NullFrameTimer(FrameTimer):
+    """A FrameTimer that doesn't time anything, for when we're not profiling.
+
+    Costs one empty method call per phase.
+    """
+
+    enabled = False
+
+    def __init__(self) -> None:
+        super().__init__(window=0)
+
+    def start_frame(self) -> None:
+        pass
+
+    def end_frame(self) -> None:
+        pass
+
+    def lap(self, phase: str) -> None:
+        pass
@@ -0,0 +1,354 @@
+from typing import Optional
+
+import tcod
+
+from ai import take_enemy_turns
+from death_functions import kill_monster, kill_player
+from entity import Entity, get_blocking_entities_at_location
+from entity_list import EntityList
+from fov_functions import initialize_fov, recompute_fov
+from frame_timer import FrameTimer, NullFrameTimer
+from game_map import GameMap
+from game_messages import Message, MessageLog
+from game_states import GameStates
+from game_types import ActionResults, UserAction
+from initialize_new_game import constants
+from pathfinding import PathGraph
+from render_functions import DirtyTracker, RenderLayers
+
+
+class Game:
+    """The rules of the game, without any input or output.
+
+    Feed it the player's actions with step().  It needs no window, so you
+    can also run it headless, e.g. to see how many turns per second we can
+    do (see headless.py).
+
+    The DirtyTracker hears about everything that changes on screen, for
+    whoever wants to draw it.
+    """
+
+    def __init__(self, player: Entity, entities: EntityList,
+                 game_map: GameMap, message_log: MessageLog,
+                 game_state: GameStates,
+                 timer: Optional[FrameTimer] = None) -> None:
+        self.player = player
+        self.entities = entities
+        self.game_map = game_map
+        self.message_log = message_log
+
+        self.fov_map = initialize_fov(game_map)
+        self.fov_recompute = True
+
+        if player.fighter.hp > 0:
+            self.game_state = GameStates.PLAYERS_TURN
+        else:
+            self.game_state = GameStates.PLAYER_DEAD
+        self.previous_game_state = self.game_state
+
+        self.targeting_item: Optional[Entity] = None
+
+        # The DirtyTracker hears about every entity move from the EntityList
+        self.dirty = DirtyTracker()
+        entities.watchers.append(self.dirty)
+
+        # step() times the player's and the monsters' turns with this
+        self.timer = timer if timer is not None else NullFrameTimer()
+
+    def close(self) -> None:
+        """Stop watching the entities."""
+        self.entities.watchers.remove(self.dirty)
+
+    @property
+    def target_radius(self) -> int:
+        """Radius of the area the targeted item affects, for drawing it."""
+        if self.targeting_item and self.targeting_item.item:
+            return self.targeting_item.item.function_kwargs.get('radius', 0)
+        return 0
+
+    def update_fov(self) -> bool:
+        """Recompute the field of view, if needed.
+
+        Everything the player can see now, they have explored.
+
+        Returns True if it was recomputed.
+        """
+        if not self.fov_recompute:
+            return False
+        recompute_fov(self.fov_map, self.player.x, self.player.y,
+                      constants.fov_radius, constants.fov_light_walls,
+                      constants.fov_algorithm)
+        # This used to happen when drawing the map, but it's part of the
+        # game (it gets saved), and it mustn't depend on whether we draw
+        self.game_map.explored |= self.fov_map.fov
+        self.fov_recompute = False
+        return True
+
+    def step(self, action: UserAction) -> ActionResults:
+        """Do what the player wants, and then let the monsters move.
+
+        Returns what the caller may want to know about:
+
+        - {'exit': True} when the player wants to leave to the main menu
+        - {'new_floor': True} when the player took the stairs
+        - {'end_turn': True} when the monsters are done with their turn
+        """
+        player = self.player
+        game_map = self.game_map
+        message_log = self.message_log
+        dirty = self.dirty
+
+        self.update_fov()
+
+        move = action.get('move')
+        wait = action.get('wait')
+        pickup = action.get('pickup')
+        show_inventory = action.get('show_inventory')
+        drop_inventory = action.get('drop_inventory')
+        inventory_index = action.get('inventory_index')
+        show_character_screen = action.get('show_character_screen')
+        take_stairs = action.get('take_stairs')
+        level_up = action.get('level_up')
+        exit = action.get('exit')
+
+        left_click = action.get('left_click')
+        right_click = action.get('right_click')
+
+        results: ActionResults = []
+        player_turn_results: ActionResults = []
+
+        if action:
+            # Pretty much any action can change what the panel shows: HP,
+            # XP, messages
+            dirty.mark(RenderLayers.PANEL)
+
+        if move and self.game_state == GameStates.PLAYERS_TURN:
+            dx, dy = move
+            new_x = player.x + dx
+            new_y = player.y + dy
+            if not game_map.is_blocked(new_x, new_y):
+                target = get_blocking_entities_at_location(
+                    self.entities, new_x, new_y)
+                if target:
+                    player_turn_results.extend(player.fighter.attack(target))
+                else:
+                    player.move(dx, dy)
+                    self.fov_recompute = True
+
+                self.game_state = GameStates.ENEMY_TURN
+
+        if wait and self.game_state == GameStates.PLAYERS_TURN:
+            self.game_state = GameStates.ENEMY_TURN
+
+        if pickup and self.game_state == GameStates.PLAYERS_TURN:
+            for entity in self.entities.at(player.x, player.y):
+                if entity.item:
+                    player_turn_results.extend(
+                        player.inventory.add_item(entity))
+                    break
+            else:
+                message_log.add_message(
+                    Message('There is nothing here to pick up.', tcod.yellow))
+
+        if show_inventory:
+            self.previous_game_state = self.game_state
+            self.game_state = GameStates.SHOW_INVENTORY
+
+        if drop_inventory:
+            self.previous_game_state = self.game_state
+            self.game_state = GameStates.DROP_INVENTORY
+
+        if (inventory_index is not None
+                and self.previous_game_state != GameStates.PLAYER_DEAD
+                and inventory_index < len(player.inventory.items)):
+            item = player.inventory.items[inventory_index]
+            if self.game_state == GameStates.SHOW_INVENTORY:
+                player_turn_results.extend(
+                    player.inventory.use(item, entities=self.entities,
+                                         fov_map=self.fov_map))
+            elif self.game_state == GameStates.DROP_INVENTORY:
+                player_turn_results.extend(player.inventory.drop_item(item))
+
+        if take_stairs and self.game_state == GameStates.PLAYERS_TURN:
+            for entity in self.entities.at(player.x, player.y):
+                if entity.stairs:
+                    # The floor we're leaving is kept for later, and
+                    # shouldn't keep telling us about its entities
+                    self.close()
+                    self.entities = game_map.change_floor(
+                        entity.stairs.floor, player, self.entities,
+                        message_log, constants)
+                    self.entities.watchers.append(dirty)
+                    self.fov_map = initialize_fov(game_map)
+                    self.fov_recompute = True
+                    dirty.mark_all()
+                    results.append({'new_floor': True})
+                    break
+            else:
+                message_log.add_message(
+                    Message('There are no stairs here.', tcod.yellow))
+
+        if level_up:
+            if level_up == 'hp':
+                player.fighter.base_max_hp += 20
+                player.fighter.hp += 20
+            elif level_up == 'str':
+                player.fighter.base_power += 1
+            elif level_up == 'def':
+                player.fighter.base_defense += 1
+            self.game_state = self.previous_game_state
+
+        if show_character_screen:
+            self.previous_game_state = self.game_state
+            self.game_state = GameStates.CHARACTER_SCREEN
+
+        if self.game_state == GameStates.TARGETING:
+            if left_click:
+                target_x, target_y = left_click
+                player_turn_results.extend(
+                    player.inventory.use(
+                        self.targeting_item, entities=self.entities,
+                        fov_map=self.fov_map,
+                        target_x=target_x, target_y=target_y))
+            elif right_click:
+                player_turn_results.append({
+                    'targeting_cancelled': True,
+                })
+
+        if exit:
+            if self.game_state in (GameStates.SHOW_INVENTORY,
+                                   GameStates.DROP_INVENTORY,
+                                   GameStates.CHARACTER_SCREEN):
+                self.game_state = self.previous_game_state
+            elif self.game_state == GameStates.TARGETING:
+                player_turn_results.append({
+                    'targeting_cancelled': True,
+                })
+            else:
+                results.append({'exit': True})
+                return results
+
+        for player_turn_result in player_turn_results:
+            message = player_turn_result.get('message')
+            dead_entity = player_turn_result.get('dead')
+            item_added: Optional[Entity] = player_turn_result.get('item_added')
+            item_consumed = player_turn_result.get('consumed')
+            item_dropped = player_turn_result.get('item_dropped')
+            equip = player_turn_result.get('equip')
+            targeting = player_turn_result.get('targeting')
+            targeting_cancelled = player_turn_result.get('targeting_cancelled')
+            xp = player_turn_result.get('xp')
+
+            if message:
+                message_log.add_message(message)
+
+            if dead_entity:
+                if dead_entity == player:
+                    message, self.game_state = kill_player(dead_entity)
+                else:
+                    message = kill_monster(dead_entity)
+
+                message_log.add_message(message)
+                dirty.mark_entity(dead_entity)
+
+            if item_added:
+                dirty.mark_entity(item_added)
+                self.entities.remove(item_added)
+                self.game_state = GameStates.ENEMY_TURN
+
+            if item_consumed:
+                self.game_state = GameStates.ENEMY_TURN
+
+            if targeting:
+                self.previous_game_state = GameStates.PLAYERS_TURN
+                self.game_state = GameStates.TARGETING
+                self.targeting_item = targeting
+                message_log.add_message(
+                    targeting.item.targeting_message)
+
+            if targeting_cancelled:
+                self.game_state = self.previous_game_state
+                message_log.add_message(Message('Targeting cancelled'))
+
+            if item_dropped:
+                self.entities.append(item_dropped)
+                dirty.mark_entity(item_dropped)
+                self.game_state = GameStates.ENEMY_TURN
+
+            if equip:
+                equip_results = player.equipment.toggle_equip(equip)
+                for equip_result in equip_results:
+                    equipped = equip_result.get('equipped')
+                    dequipped = equip_result.get('dequipped')
+                    if equipped:
+                        message_log.add_message(Message(
+                            f"You equipped the {equipped.name}."
+                        ))
+                    if dequipped:
+                        message_log.add_message(Message(
+                            f"You removed the {dequipped.name}."
+                        ))
+                self.game_state = GameStates.ENEMY_TURN
+
+            if xp:
+                leveled_up = player.level.add_xp(xp)
+                message_log.add_message(
+                    Message(f'You gain {xp} experience points.'))
+                if leveled_up:
+                    message_log.add_message(Message(
+                        f'Your battle skills grow stronger!'
+                        f' You reached level {player.level.current_level}!',
+                        tcod.yellow))
+                    self.previous_game_state = self.game_state
+                    self.game_state = GameStates.LEVEL_UP
+
+        self.timer.lap('player')
+
+        if self.game_state == GameStates.ENEMY_TURN:
+            if self.take_enemy_turns():
+                results.append({'end_turn': True})
+            self.timer.lap('enemies')
+
+        return results
+
+    def take_enemy_turns(self) -> bool:
+        """Let the monsters move.
+
+        Returns False if the player died before they were all done.
+        """
+        player = self.player
+        entities = self.entities
+        message_log = self.message_log
+        dirty = self.dirty
+
+        dirty.mark(RenderLayers.PANEL)
+        # All the monsters share one pathfinding graph for this turn
+        entities.path_graph = PathGraph(self.game_map, entities,
+                                        constants.monster_flow_field)
+        try:
+            for enemy_turn_results in take_enemy_turns(
+                    player, self.fov_map, self.game_map, entities):
+                for enemy_turn_result in enemy_turn_results:
+                    message = enemy_turn_result.get('message')
+                    dead_entity = enemy_turn_result.get('dead')
+
+                    if message:
+                        message_log.add_message(message)
+
+                    if dead_entity:
+                        if dead_entity == player:
+                            message, self.game_state = kill_player(
+                                dead_entity)
+                        else:
+                            message = kill_monster(dead_entity)
+
+                        message_log.add_message(message)
+                        dirty.mark_entity(dead_entity)
+
+                        if self.game_state == GameStates.PLAYER_DEAD:
+                            return False
+        finally:
+            entities.path_graph = None
+
+        self.game_state = GameStates.PLAYERS_TURN
+        return True
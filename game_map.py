@@ -1,19 +1,25 @@
 import random
-from typing import TYPE_CHECKING, List, Type
+from typing import (
+    TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple, Type, Union,
+)
 
+import numpy as np
 import tcod
+import tcod.map
 
 from ai import BasicMonster
 from entity import Entity
+from entity_list import EntityList
 from equipment_slots import EquipmentSlots
 from equippable import Equippable
 from fighter import Fighter
+from floor_store import Floor, FloorStore
 from game_messages import Message, MessageLog
 from item import Item
 from item_functions import cast_confuse, cast_fireball, cast_lightning, heal
-from map_objects import Tile
+from map_objects import Tile, TileGrid
 from random_utils import from_dungeon_level, random_choice_from_dict
-from rectangle import Rect
+from rectangle import Area, Rect, h_tunnel, v_tunnel
 from render_functions import RenderOrder
 from stairs import Stairs
 
@@ -24,24 +30,109 @@ if TYPE_CHECKING:
 class GameMap:
 
     def __init__(self, width: int, height: int,
-                 dungeon_level: int = 1) -> None:
+                 dungeon_level: int = 1,
+                 floors: Optional[FloorStore] = None) -> None:
         self.width = width
         self.height = height
-        self.tiles = self.initialize_tiles()
+        self.initialize_tiles()
         self.dungeon_level = dungeon_level
-
-    def initialize_tiles(self) -> List[List[Tile]]:
-        # Whoa there, a column-major matrix?  You don't see those every day!
-        tiles = [
-            [Tile(blocked=True) for y in range(self.height)]
-            for x in range(self.width)
-        ]
-
-        return tiles
+        # The other floors we've been on
+        self.floors = floors if floors is not None else FloorStore()
+
+    def initialize_tiles(self) -> None:
+        # One boolean array per tile property instead of one Tile object per
+        # tile.  Still column-major (order='F', indexed by [x, y]), like the
+        # list of lists we used to have, and like our consoles and FOV maps.
+        shape = (self.width, self.height)
+        self.blocked = np.ones(shape, dtype=bool, order='F')
+        self.block_sight = np.ones(shape, dtype=bool, order='F')
+        self.explored = np.zeros(shape, dtype=bool, order='F')
+        # Bumped every time blocked/block_sight change, so anyone who
+        # remembers things about the map (e.g. paths) knows when to forget
+        self.version = 0
+        self.initialize_fov_map()
+
+    def initialize_fov_map(self) -> None:
+        # The one and only FOV map, used for both FOV and pathfinding.
+        # We keep it in sync with blocked/block_sight as the tiles change, so
+        # nobody ever needs to copy the map tile by tile.
+        self.fov_map = tcod.map.Map(self.width, self.height, order='F')
+        self.sync_fov_map()
+
+    def sync_fov_map(
+        self, area: Union[Area, Tuple[int, int]] = (slice(None), slice(None)),
+    ) -> None:
+        """Update the FOV map after changing blocked/block_sight directly.
+
+        Pass the area you changed, or the (x, y) of a single tile.
+        """
+        self.fov_map.transparent[area] = ~self.block_sight[area]
+        self.fov_map.walkable[area] = ~self.blocked[area]
+        self.version += 1
+
+    def reset_tiles(self) -> None:
+        """Fill the map with solid rock, reusing the existing arrays."""
+        self.blocked.fill(True)
+        self.block_sight.fill(True)
+        self.explored.fill(False)
+        self.fov_map.transparent.fill(False)
+        self.fov_map.walkable.fill(False)
+        self.version += 1
+
+    def get_tiles(self) -> np.ndarray:
+        """Return a copy of blocked, block_sight and explored, stacked."""
+        return np.stack([self.blocked, self.block_sight, self.explored])
+
+    def set_tiles(self, tiles: np.ndarray) -> None:
+        """Undo get_tiles()."""
+        self.blocked[...], self.block_sight[...], self.explored[...] = tiles
+        self.sync_fov_map()
+
+    @property
+    def tiles(self) -> TileGrid:
+        """Tile-by-tile access, for when you really want game_map.tiles[x][y].
+
+        It's much faster to use the blocked/block_sight/explored arrays
+        directly.
+        """
+        return TileGrid(self)
+
+    def set_tile(self, x: int, y: int, tile: Tile) -> None:
+        self.blocked[x, y] = tile.blocked
+        self.block_sight[x, y] = tile.block_sight
+        self.explored[x, y] = tile.explored
+        self.sync_fov_map((x, y))
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # The FOV map can be rebuilt from the tiles, no need to save it.
+        # The other floors are not worth saving in the old format, which we
+        # only read now.
+        state = self.__dict__.copy()
+        del state['fov_map']
+        state.pop('floors', None)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        # Saves made before we switched to arrays have a list of lists of
+        # Tile objects instead
+        tiles = state.pop('tiles', None)
+        state.setdefault('version', 0)
+        state.setdefault('floors', FloorStore())
+        self.__dict__.update(state)
+        if tiles is not None:
+            self.initialize_tiles()
+            for x, column in enumerate(tiles):
+                for y, tile in enumerate(column):
+                    self.set_tile(x, y, tile)
+        else:
+            self.initialize_fov_map()
 
     def make_map(self, max_rooms: int, room_min_size: int, room_max_size: int,
-                 player: Entity, entities: List[Entity]) -> None:
+                 player: Entity, entities: EntityList) -> None:
         rooms: List[Rect] = []
+        # We collect everything that needs to be dug out and carve it all at
+        # once in the end.  Nothing below looks at the tiles, so that's safe.
+        areas: List[Area] = []
 
         for r in range(max_rooms):
             # random width and height
@@ -62,7 +153,7 @@ class GameMap:
                 # this means there are no intersections, so this room is valid
 
                 # "paint" it to the map's tiles
-                self.create_room(new_room)
+                areas.append(new_room.inner())
 
                 # center coordinates of new room, will be useful later
                 new_x, new_y = new_room.center()
@@ -80,18 +171,20 @@ class GameMap:
                     # flip a coin
                     if random.randrange(2):
                         # first move horizontally, then vertically
-                        self.create_h_tunnel(prev_x, new_x, prev_y)
-                        self.create_v_tunnel(prev_y, new_y, new_x)
+                        areas.append(h_tunnel(prev_x, new_x, prev_y))
+                        areas.append(v_tunnel(prev_y, new_y, new_x))
                     else:
                         # first move vertically, then horizontally
-                        self.create_v_tunnel(prev_y, new_y, prev_x)
-                        self.create_h_tunnel(prev_x, new_x, new_y)
+                        areas.append(v_tunnel(prev_y, new_y, prev_x))
+                        areas.append(h_tunnel(prev_x, new_x, new_y))
 
                 self.place_entities(new_room, entities)
 
                 # finally, append the new room to the list
                 rooms.append(new_room)
 
+        self.carve(areas)
+
         center_of_last_room_x, center_of_last_room_y = rooms[-1].center()
         down_stairs = Entity(center_of_last_room_x, center_of_last_room_y,
                              '>', tcod.white, 'Stairs',
@@ -99,21 +192,38 @@ class GameMap:
                              stairs=Stairs(self.dungeon_level + 1))
         entities.append(down_stairs)
 
+        if self.dungeon_level > 1:
+            # The way back, right where the player arrives
+            up_stairs = Entity(player.x, player.y, '<', tcod.white,
+                               'Stairs Up', render_order=RenderOrder.STAIRS,
+                               stairs=Stairs(self.dungeon_level - 1))
+            entities.append(up_stairs)
+
+    def carve(self, areas: Iterable[Area]) -> None:
+        """Make all the tiles in the given areas passable.
+
+        Each area is a pair of slices, like the ones you get from
+        Rect.inner(), h_tunnel() or v_tunnel().  This costs one array
+        operation per area, no matter how big the areas are.
+        """
+        for area in areas:
+            self.blocked[area] = False
+            self.block_sight[area] = False
+            self.fov_map.transparent[area] = True
+            self.fov_map.walkable[area] = True
+            self.version += 1
+
     def create_room(self, room: Rect) -> None:
-        # go through the tiles in the rectangle and make them passable
-        for x in range(room.x1 + 1, room.x2):
-            for y in range(room.y1 + 1, room.y2):
-                self.tiles[x][y] = Tile(blocked=False)
+        # make the tiles inside the rectangle passable
+        self.carve([room.inner()])
 
     def create_h_tunnel(self, x1: int, x2: int, y: int) -> None:
-        for x in range(min(x1, x2), max(x1, x2) + 1):
-            self.tiles[x][y] = Tile(blocked=False)
+        self.carve([h_tunnel(x1, x2, y)])
 
     def create_v_tunnel(self, y1: int, y2: int, x: int) -> None:
-        for y in range(min(y1, y2), max(y1, y2) + 1):
-            self.tiles[x][y] = Tile(blocked=False)
+        self.carve([v_tunnel(y1, y2, x)])
 
-    def place_entities(self, room: Rect, entities: List[Entity]) -> None:
+    def place_entities(self, room: Rect, entities: EntityList) -> None:
         max_monsters_per_room = from_dungeon_level(self.dungeon_level, [
             # value, first level for this value
             (2, 1),
@@ -159,8 +269,7 @@ class GameMap:
             x = random.randrange(room.x1 + 1, room.x2)
             y = random.randrange(room.y1 + 1, room.y2)
 
-            if not any(x == entity.x and y == entity.y
-                       for entity in entities):
+            if not entities.at(x, y):
                 monster_choice = random_choice_from_dict(monster_chances)
                 if monster_choice == 'orc':
                     monster = Entity(
@@ -184,8 +293,7 @@ class GameMap:
             x = random.randrange(room.x1 + 1, room.x2)
             y = random.randrange(room.y1 + 1, room.y2)
 
-            if not any(x == entity.x and y == entity.y
-                       for entity in entities):
+            if not entities.at(x, y):
                 item_choice = random_choice_from_dict(item_chances)
                 if item_choice == 'healing_potion':
                     item = Entity(x, y, '!', tcod.violet, 'Healing Potion',
@@ -236,17 +344,38 @@ class GameMap:
 
     def is_blocked(self, x: int, y: int) -> bool:
         if 0 <= x < self.width and 0 <= y < self.height:
-            return self.tiles[x][y].blocked
+            return bool(self.blocked[x, y])
         else:
             return True
 
-    def next_floor(self, player: Entity,
-                   message_log: MessageLog,
-                   constants: Type['constants']) -> List[Entity]:
-        self.dungeon_level += 1
-        entities = [player]
+    def change_floor(self, dungeon_level: int, player: Entity,
+                     entities: EntityList, message_log: MessageLog,
+                     constants: Type['constants']) -> EntityList:
+        """Take the player to another floor.
+
+        The current floor goes into self.floors, in case the player comes
+        back.  Returns the entities of the new floor.
+        """
+        previous_level = self.dungeon_level
+        entities.remove(player)
+        self.floors.put(previous_level, Floor(entities, self.get_tiles()))
+        self.dungeon_level = dungeon_level
+
+        if dungeon_level in self.floors:
+            floor = self.floors.take(dungeon_level)
+            self.set_tiles(floor.tiles)
+            entities = floor.entities
+            # Arrive on the stairs we'd take to go back
+            for entity in entities.with_component('stairs'):
+                if entity.stairs.floor == previous_level:
+                    player.place(entity.x, entity.y)
+                    break
+            entities.append(player)
+            return entities
+
+        entities = EntityList([player], columnar=constants.columnar_entities)
 
-        self.tiles = self.initialize_tiles()
+        self.reset_tiles()
         self.make_map(
             constants.max_rooms, constants.room_min_size,
             constants.room_max_size, player, entities)
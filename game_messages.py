@@ -1,33 +1,131 @@
+import json
+import os
 import textwrap
-from typing import List
+from collections import deque
+from functools import lru_cache
+from typing import Any, Deque, Dict, Iterator, Optional, TextIO, Tuple
 
 import tcod
 
+from components import Slotted
 
-class Message:
+
+class Message(Slotted):
+    __slots__ = ('text', 'color')
 
     def __init__(self, text: str, color: tcod.Color = tcod.white) -> None:
         self.text = text
         self.color = color
 
 
+@lru_cache(maxsize=256)
+def wrap(text: str, color: Tuple[int, int, int],
+         width: int) -> Tuple[Message, ...]:
+    """Split a message into lines of at most width characters.
+
+    Combat produces the same few messages over and over ("Orc attacks
+    Player for 3 hit points."), so the results are cached.  Every copy of
+    a message shares the same line objects, so don't change them.
+    """
+    return tuple(Message(line, color)
+                 for line in textwrap.wrap(text, width))
+
+
 class MessageLog:
+    """The messages shown in the panel, plus older ones for scrollback.
+
+    self.messages has the last height lines, already wrapped to fit width,
+    ready to be drawn.  self.history has the last history_size messages
+    as they were added (not wrapped).  Messages that fall out of the history
+    get appended to spill_file, if you give one; full_history() reads them
+    back.  A history_size of 0 sends every message straight to the
+    spill_file.
+    """
 
-    def __init__(self, x: int, width: int, height: int) -> None:
-        self.messages: List[Message] = []
+    def __init__(self, x: int, width: int, height: int,
+                 history_size: int = 1000,
+                 spill_file: Optional[str] = None) -> None:
+        self.messages: Deque[Message] = deque(maxlen=height)
+        self.history: Deque[Message] = deque(maxlen=history_size)
+        self.spill_file = spill_file
+        # Opened when we first spill something, and kept open
+        self.spill_stream: Optional[TextIO] = None
         self.x = x
         self.width = width
         self.height = height
 
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        if 'history' not in state:
+            # Saves from before we had history have a list of visible lines
+            state['history'] = deque(state['messages'], maxlen=1000)
+            state['messages'] = deque(state['messages'],
+                                      maxlen=state['height'])
+            state['spill_file'] = None
+        state['spill_stream'] = None
+        self.__dict__.update(state)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        # Open files don't pickle
+        state['spill_stream'] = None
+        return state
+
     def add_message(self, message: Message) -> None:
-        # Split the message if necessary, among multiple lines
-        new_msg_lines = textwrap.wrap(message.text, self.width)
+        history = self.history
+        if history.maxlen == 0:
+            self.spill(message)
+        else:
+            if len(history) == history.maxlen:
+                self.spill(history.popleft())
+            history.append(message)
+
+        # Split the message if necessary, among multiple lines.  The deque
+        # drops the oldest lines to make room for the new ones.
+        r, g, b = message.color
+        self.messages.extend(wrap(message.text, (r, g, b), self.width))
+
+    def spill(self, message: Message) -> None:
+        """Save a message that no longer fits in the history to disk."""
+        if self.spill_file is None:
+            return
+        if self.spill_stream is None:
+            self.spill_stream = open(self.spill_file, 'a')
+        # Buffered; see flush()
+        self.spill_stream.write(
+            json.dumps([message.text, list(message.color)]) + '\n')
+
+    def flush(self) -> None:
+        """Make sure everything we spilled is on disk (e.g. before saving)."""
+        if self.spill_stream is not None:
+            self.spill_stream.flush()
+
+    def close(self) -> None:
+        if self.spill_stream is not None:
+            self.spill_stream.close()
+            self.spill_stream = None
+
+    def clear_spill_file(self) -> None:
+        """Forget the messages spilled to disk, e.g. from a previous game."""
+        self.close()
+        self.flush()
+        if self.spill_file is not None:
+            try:
+                os.unlink(self.spill_file)
+            except FileNotFoundError:
+                pass
 
-        for line in new_msg_lines:
-            # If the buffer is full, remove the first line to make room for the
-            # new one
-            if len(self.messages) == self.height:
-                del self.messages[0]
+    def full_history(self) -> Iterator[Message]:
+        """Iterate over all the messages, oldest first.
 
-            # Add the new line as a Message object, with the text and the color
-            self.messages.append(Message(line, message.color))
+        This includes the ones that were spilled to disk.
+        """
+        self.flush()
+        if self.spill_file is not None:
+            try:
+                with open(self.spill_file) as f:
+                    for line in f:
+                        text, color = json.loads(line)
+                        yield Message(text, tcod.Color(*color))
+            except FileNotFoundError:
+                pass
+        yield from self.history
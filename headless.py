@@ -0,0 +1,178 @@
+#!/usr/bin/python3
+"""Play the game without a window, and see how many turns per second we do.
+
+Usage: python3 headless.py [--turns N] [--seed N] [--columnar]
+                           [--script FILE]
+
+Without --script, the player does random things (with a preference for
+walking up to monsters and hitting them).  When the player dies, we start
+a new game, until we've done the requested number of turns.
+
+With --script, we play the actions from FILE instead, one JSON object per
+line, in a single game.  A savegame.journal.* file will do, although the
+dungeon won't be the one those actions were taken in.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Iterable, Iterator, List
+
+from game import Game
+from game_states import GameStates
+from game_types import UserAction
+from initialize_new_game import constants, get_game_variables
+
+
+DIRECTIONS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+              if dx or dy]
+
+
+def random_actions(game: Game, rng: random.Random) -> Iterator[UserAction]:
+    """Make up things for the player to do, forever."""
+    player = game.player
+    while True:
+        state = game.game_state
+        if state == GameStates.PLAYERS_TURN:
+            roll = rng.random()
+            on_stairs = any(entity.stairs for entity in
+                            game.entities.at(player.x, player.y))
+            if on_stairs and roll < 0.3:
+                yield {'take_stairs': True}
+            elif roll < 0.5:
+                monster = game.entities.nearest(
+                    player.x, player.y, constants.fov_radius,
+                    lambda entity: entity.ai)
+                if monster is not None:
+                    dx = (monster.x > player.x) - (monster.x < player.x)
+                    dy = (monster.y > player.y) - (monster.y < player.y)
+                    yield {'move': (dx, dy)}
+                else:
+                    yield {'move': rng.choice(DIRECTIONS)}
+            elif roll < 0.85:
+                yield {'move': rng.choice(DIRECTIONS)}
+            elif roll < 0.9:
+                yield {'pickup': True}
+            elif roll < 0.95:
+                yield {'wait': True}
+            elif roll < 0.98:
+                yield {'show_inventory': True}
+            elif roll < 0.99:
+                yield {'drop_inventory': True}
+            else:
+                yield {'show_character_screen': True}
+        elif state in (GameStates.SHOW_INVENTORY,
+                       GameStates.DROP_INVENTORY):
+            items = len(player.inventory.items)
+            if items and rng.random() < 0.8:
+                yield {'inventory_index': rng.randrange(items)}
+            else:
+                yield {'exit': True}
+        elif state == GameStates.TARGETING:
+            if rng.random() < 0.9:
+                x = player.x + rng.randint(-5, 5)
+                y = player.y + rng.randint(-5, 5)
+                yield {'left_click': (x, y)}
+            else:
+                yield {'right_click': (player.x, player.y)}
+        elif state == GameStates.LEVEL_UP:
+            yield {'level_up': rng.choice(['hp', 'str', 'def'])}
+        elif state == GameStates.CHARACTER_SCREEN:
+            yield {'exit': True}
+        else:
+            # Dead
+            return
+
+
+def read_script(filename: str) -> List[UserAction]:
+    with open(filename) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class Stats:
+
+    def __init__(self) -> None:
+        self.games = 0
+        self.actions = 0
+        self.turns = 0
+        self.seconds = 0.0
+        self.deepest_level = 1
+
+    def __str__(self) -> str:
+        seconds = self.seconds or 1e-9
+        return (f'{self.turns} turns, {self.actions} actions,'
+                f' {self.games} games in {self.seconds:.2f} s:'
+                f' {self.turns / seconds:.0f} turns/s,'
+                f' {self.actions / seconds:.0f} actions/s,'
+                f' deepest level {self.deepest_level}')
+
+
+def run(game: Game, actions: Iterable[UserAction], stats: Stats,
+        max_turns: int) -> None:
+    """Play the actions until they run out or we've done max_turns turns.
+
+    Only the time spent in Game.step() counts.
+    """
+    stats.games += 1
+    clock = time.perf_counter
+    for action in actions:
+        if stats.turns >= max_turns:
+            break
+        start = clock()
+        results = game.step(action)
+        stats.seconds += clock() - start
+        stats.actions += 1
+        if any(result.get('end_turn') for result in results):
+            stats.turns += 1
+        if any(result.get('exit') for result in results):
+            break
+    stats.deepest_level = max(stats.deepest_level,
+                              game.game_map.dungeon_level)
+    game.close()
+
+
+def new_game() -> Game:
+    return Game(*get_game_variables())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Play the game without a window and measure its speed.')
+    parser.add_argument('--turns', type=int, default=10000,
+                        help='stop after this many turns'
+                             ' (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=42,
+                        help='random seed (default: %(default)s)')
+    parser.add_argument('--columnar', action='store_true',
+                        help='keep entities in NumPy columns')
+    parser.add_argument('--script', metavar='FILE',
+                        help='play the actions from FILE (JSON lines)')
+    args = parser.parse_args()
+
+    constants.columnar_entities = args.columnar
+    script = read_script(args.script) if args.script else None
+
+    # Floors we leave get written to the current directory, so go
+    # somewhere they won't clobber a real saved game
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='headless-') as tmpdir:
+        os.chdir(tmpdir)
+        try:
+            random.seed(args.seed)
+            stats = Stats()
+            if script is not None:
+                run(new_game(), script, stats, args.turns)
+            else:
+                rng = random.Random(args.seed)
+                while stats.turns < args.turns:
+                    game = new_game()
+                    run(game, random_actions(game, rng), stats, args.turns)
+        finally:
+            os.chdir(cwd)
+    print(stats)
+
+
+if __name__ == '__main__':
+    main()
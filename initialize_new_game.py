@@ -1,12 +1,14 @@
-from typing import List, Tuple
+from typing import Tuple
 
 import tcod
 
 from entity import Entity
+from entity_list import EntityList
 from equipment import Equipment
 from equipment_slots import EquipmentSlots
 from equippable import Equippable
 from fighter import Fighter
+from floor_store import FloorStore
 from game_map import GameMap
 from game_messages import MessageLog
 from game_states import GameStates
@@ -28,6 +30,10 @@ class constants:
     message_x = bar_width + 2
     message_width = screen_width - bar_width - 2
     message_height = panel_height - 1
+    # How many old messages to keep for scrollback; older ones are appended
+    # to message_spill_file, if it's not None
+    message_history_size = 1000
+    message_spill_file = None
 
     map_width = 80
     map_height = 43
@@ -40,6 +46,28 @@ class constants:
     fov_light_walls = True
     fov_radius = 10
 
+    # Chase the player using one shared Dijkstra map per turn instead of
+    # an A* search per monster; worth it when there are lots of monsters
+    monster_flow_field = False
+
+    # Keep entity positions and fighter stats in NumPy arrays (see
+    # ColumnStore); helps with huge numbers of entities, costs a bit
+    # otherwise
+    columnar_entities = False
+
+    # Compression for save files: 'none', 'zlib' or 'lzma'
+    save_compression = 'zlib'
+    # Write save files in a background thread, so e.g. taking the stairs
+    # doesn't have to wait for it
+    background_saves = True
+    # Save the whole game every so many turns; in between, only the
+    # player's actions are written to the journal
+    checkpoint_interval = 100
+
+    # How many of the floors the player has left to keep in memory; the
+    # rest go to disk
+    floor_cache_size = 3
+
     colors = {
         'dark_wall': tcod.Color(0, 0, 100),
         'dark_ground': tcod.Color(50, 50, 150),
@@ -49,7 +77,7 @@ class constants:
     }
 
 
-def get_game_variables() -> Tuple[Entity, List[Entity], GameMap, MessageLog,
+def get_game_variables() -> Tuple[Entity, EntityList, GameMap, MessageLog,
                                   GameStates]:
     player = Entity(0, 0, '@', tcod.white, 'Player', blocks=True,
                     render_order=RenderOrder.ACTOR,
@@ -57,7 +85,7 @@ def get_game_variables() -> Tuple[Entity, List[Entity], GameMap, MessageLog,
                     inventory=Inventory(26),
                     equipment=Equipment(),
                     level=Level())
-    entities = [player]
+    entities = EntityList([player], columnar=constants.columnar_entities)
 
     dagger = Entity(0, 0, '-', tcod.sky, 'Dagger',
                     render_order=RenderOrder.ITEM,
@@ -67,13 +95,15 @@ def get_game_variables() -> Tuple[Entity, List[Entity], GameMap, MessageLog,
     player.inventory.add_item(dagger)
     player.equipment.toggle_equip(dagger)
 
-    game_map = GameMap(constants.map_width, constants.map_height)
+    game_map = GameMap(constants.map_width, constants.map_height,
+                       floors=FloorStore(constants.floor_cache_size))
     game_map.make_map(
         constants.max_rooms, constants.room_min_size, constants.room_max_size,
         player, entities)
 
     message_log = MessageLog(
-        constants.message_x, constants.message_width, constants.message_height)
+        constants.message_x, constants.message_width, constants.message_height,
+        constants.message_history_size, constants.message_spill_file)
 
     game_state = GameStates.PLAYERS_TURN
 
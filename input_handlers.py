@@ -61,7 +61,8 @@ def handle_player_turn_keys(event: tcod.event.KeyboardEvent) -> UserAction:
     if event.sym == tcod.event.K_c:
         return {'show_character_screen': True}
 
-    if event.sym in (tcod.event.K_GREATER, tcod.event.K_RETURN):
+    if event.sym in (tcod.event.K_GREATER, tcod.event.K_LESS,
+                     tcod.event.K_RETURN):
         # XXX: K_GREATER is not what I thought it was!
         return {'take_stairs': True}
 
@@ -9,6 +9,7 @@ from game_types import ActionResults
 
 
 class Inventory(Component):
+    __slots__ = ('capacity', 'items')
 
     def __init__(self, capacity: int):
         self.capacity = capacity
@@ -1,10 +1,13 @@
 from typing import Any, Optional
 
+from components import Component
 from game_messages import Message
 from game_types import ItemFunction
 
 
-class Item:
+class Item(Component):
+    __slots__ = ('use_function', 'targeting', 'targeting_message',
+                 'function_kwargs')
 
     def __init__(
         self, use_function: Optional[ItemFunction] = None,
@@ -1,4 +1,4 @@
-from typing import Any, List
+from typing import TYPE_CHECKING, Any
 
 import tcod
 
@@ -7,6 +7,9 @@ from entity import Entity
 from game_messages import Message
 from game_types import ActionResults
 
+if TYPE_CHECKING:
+    from entity_list import EntityList
+
 
 def heal(entity: Entity, *, amount: int, **_: Any) -> ActionResults:
     results = []
@@ -28,21 +31,15 @@ def heal(entity: Entity, *, amount: int, **_: Any) -> ActionResults:
 
 
 def cast_lightning(
-    caster: Entity, *, entities: List[Entity], fov_map: tcod.map.Map,
+    caster: Entity, *, entities: 'EntityList', fov_map: tcod.map.Map,
     damage: int, maximum_range: float, **_: Any
 ) -> ActionResults:
     results = []
 
-    target = None
-    closest_distance = maximum_range + 1
-
-    for entity in entities:
-        if (entity.fighter and entity != caster
-                and fov_map.fov[entity.x, entity.y]):
-            distance = caster.distance_to(entity)
-            if distance < closest_distance:
-                target = entity
-                closest_distance = distance
+    target = entities.nearest(
+        caster.x, caster.y, maximum_range + 1,
+        lambda entity: (entity.fighter and entity != caster
+                        and fov_map.fov[entity.x, entity.y]))
 
     if target:
         results.append({
@@ -68,7 +65,7 @@ def cast_lightning(
 
 
 def cast_fireball(
-    entity: Entity, *, entities: List[Entity], fov_map: tcod.map.Map,
+    entity: Entity, *, entities: 'EntityList', fov_map: tcod.map.Map,
     damage: int, radius: int, target_x: int, target_y: int, **_: Any
 ) -> ActionResults:
     results = []
@@ -92,8 +89,21 @@ def cast_fireball(
         ),
     })
 
-    for entity in entities:
-        if entity.distance(target_x, target_y) <= radius and entity.fighter:
+    victims = entities.fighters_within(target_x, target_y, radius)
+    if entities.columns is not None:
+        # Burn everyone at once, and find out who died
+        died = entities.columns.take_damage(victims, damage).tolist()
+        for entity, dead in zip(victims, died):
+            results.append({
+                'message': Message(
+                    f"The {entity.name} gets burned for {damage} hit points.",
+                    tcod.orange,
+                ),
+            })
+            if dead:
+                results.append({'dead': entity, 'xp': entity.fighter.xp})
+    else:
+        for entity in victims:
             results.append({
                 'message': Message(
                     f"The {entity.name} gets burned for {damage} hit points.",
@@ -106,7 +116,7 @@ def cast_fireball(
 
 
 def cast_confuse(
-    entity: Entity, *, fov_map: tcod.map.Map, entities: List[Entity],
+    entity: Entity, *, fov_map: tcod.map.Map, entities: 'EntityList',
     target_x: int, target_y: int, **_: Any
 ) -> ActionResults:
     results = []
@@ -121,8 +131,8 @@ def cast_confuse(
         })
         return results
 
-    for entity in entities:
-        if entity.x == target_x and entity.y == target_y and entity.ai:
+    for entity in entities.at(target_x, target_y):
+        if entity.ai:
             confused_ai = ConfusedMonster(entity.ai, 10)
             confused_ai.owner = entity
             entity.ai = confused_ai
@@ -0,0 +1,119 @@
+import glob
+import json
+import os
+from collections import deque
+from typing import Deque, List, Optional, TextIO, Tuple
+
+from game_types import UserAction
+
+
+JOURNAL_PREFIX = 'savegame.journal.'
+
+
+def journal_files() -> List[Tuple[int, str]]:
+    """Return (number of the first action, file name) of all journal files.
+
+    They come in order.
+    """
+    files = []
+    for filename in glob.glob(glob.escape(JOURNAL_PREFIX) + '*'):
+        suffix = filename[len(JOURNAL_PREFIX):]
+        if suffix.isdigit():
+            files.append((int(suffix), filename))
+    return sorted(files)
+
+
+class Journal:
+    """Everything the player did since the last save, for crash recovery.
+
+    Saving the whole game takes a while, so we do it only every so often
+    (a checkpoint, see save_game()).  In between we append each action the
+    player takes to a journal file, which only costs a few bytes per
+    action.  The save file has the state of the random number generator and
+    the number of actions taken so far, so after a crash we can load it and
+    replay the actions from the journal to get back to exactly where we
+    were.
+
+    Every checkpoint starts a new journal file, named after the number of
+    the first action in it.  Old journal files get deleted once a newer
+    save is safely on disk.
+    """
+
+    def __init__(self, action_count: int = 0, turn: int = 0) -> None:
+        # Since the start of the game
+        self.action_count = action_count
+        self.turn = turn
+        # When we last saved
+        self.saved_action_count = action_count
+        self.saved_turn = turn
+        # Actions read back from the journal files, still to be replayed
+        self.replay: Deque[UserAction] = deque()
+        self.file: Optional[TextIO] = None
+
+    def record(self, action: UserAction) -> None:
+        if self.file is None:
+            # If a file with this name exists, it can only have a half
+            # written action from before a crash (see recover())
+            self.file = open(JOURNAL_PREFIX + str(self.action_count), 'w')
+        self.file.write(json.dumps(action) + '\n')
+        # Buffered, but we flush after every action, so it survives the
+        # game crashing (but not necessarily the computer crashing)
+        self.file.flush()
+        self.action_count += 1
+
+    def next_replayed_action(self) -> UserAction:
+        self.action_count += 1
+        return self.replay.popleft()
+
+    def end_turn(self) -> None:
+        self.turn += 1
+
+    def checkpoint_due(self, interval: int) -> bool:
+        return self.turn - self.saved_turn >= interval
+
+    def saved(self) -> None:
+        """Note that the game was saved; save_game() calls this."""
+        self.saved_action_count = self.action_count
+        self.saved_turn = self.turn
+        # Start a new journal file for the actions after this save
+        self.close()
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def recover(self) -> None:
+        """Read back the actions the player took after the last save."""
+        for start, filename in journal_files():
+            with open(filename) as f:
+                for number, line in enumerate(f, start):
+                    expected = self.action_count + len(self.replay)
+                    if number < expected:
+                        continue
+                    if number > expected:
+                        # A gap?  Can't replay past it.
+                        return
+                    try:
+                        self.replay.append(json.loads(line))
+                    except ValueError:
+                        # We crashed halfway through writing this one.  The
+                        # next file, if any, starts right after the last
+                        # good line.
+                        break
+
+    def prune(self) -> None:
+        """Delete journal files with only actions from before the last save.
+
+        Call this only when the last save is safely on disk.
+        """
+        files = journal_files()
+        for (start, filename), (next_start, _) in zip(files, files[1:]):
+            if next_start <= self.saved_action_count:
+                os.remove(filename)
+
+    @staticmethod
+    def clear() -> None:
+        """Delete all the journal files, e.g. when starting a new game."""
+        for start, filename in journal_files():
+            os.remove(filename)
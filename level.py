@@ -1,4 +1,9 @@
-class Level:
+from components import Component
+
+
+class Level(Component):
+    __slots__ = ('current_level', 'current_xp', 'level_up_base',
+                 'level_up_factor')
 
     def __init__(self, current_level: int = 1, current_xp: int = 0,
                  level_up_base: int = 200, level_up_factor: int = 150):
@@ -1,10 +1,16 @@
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from game_map import GameMap
 
 
 class Tile:
     """A tile on a map.
 
     It may or may not be blocked, and may or may not block sight.
+
+    GameMap doesn't keep Tile objects around (it stores each property in a
+    separate array), but you can still pass one to GameMap.set_tile().
     """
 
     def __init__(self, blocked: bool, block_sight: Optional[bool] = None):
@@ -16,3 +22,75 @@ class Tile:
 
         self.block_sight = block_sight
         self.explored = False
+
+
+class TileView:
+    """A single tile of a GameMap that looks like a Tile.
+
+    Reading or writing the attributes reads or writes the map's arrays.
+    """
+
+    def __init__(self, game_map: 'GameMap', x: int, y: int) -> None:
+        self.game_map = game_map
+        self.x = x
+        self.y = y
+
+    @property
+    def blocked(self) -> bool:
+        return bool(self.game_map.blocked[self.x, self.y])
+
+    @blocked.setter
+    def blocked(self, value: bool) -> None:
+        self.game_map.blocked[self.x, self.y] = value
+        self.game_map.sync_fov_map((self.x, self.y))
+
+    @property
+    def block_sight(self) -> bool:
+        return bool(self.game_map.block_sight[self.x, self.y])
+
+    @block_sight.setter
+    def block_sight(self, value: bool) -> None:
+        self.game_map.block_sight[self.x, self.y] = value
+        self.game_map.sync_fov_map((self.x, self.y))
+
+    @property
+    def explored(self) -> bool:
+        return bool(self.game_map.explored[self.x, self.y])
+
+    @explored.setter
+    def explored(self, value: bool) -> None:
+        self.game_map.explored[self.x, self.y] = value
+
+
+class TileColumn:
+    """One column of a GameMap, so game_map.tiles[x][y] keeps working."""
+
+    def __init__(self, game_map: 'GameMap', x: int) -> None:
+        self.game_map = game_map
+        self.x = x
+
+    def __len__(self) -> int:
+        return self.game_map.height
+
+    def __getitem__(self, y: int) -> TileView:
+        if not 0 <= y < self.game_map.height:
+            raise IndexError(y)
+        return TileView(self.game_map, self.x, y)
+
+    def __setitem__(self, y: int, tile: Tile) -> None:
+        self.game_map.set_tile(self.x, y, tile)
+
+
+class TileGrid:
+    """Column-major access to all the tiles of a GameMap."""
+
+    def __init__(self, game_map: 'GameMap') -> None:
+        self.game_map = game_map
+
+    def __len__(self) -> int:
+        return self.game_map.width
+
+    def __getitem__(self, x: int) -> TileColumn:
+        if not 0 <= x < self.game_map.width:
+            raise IndexError(x)
+        return TileColumn(self.game_map, x)
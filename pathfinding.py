@@ -0,0 +1,172 @@
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+import numpy as np
+import tcod.path
+
+from components import Slotted
+
+if TYPE_CHECKING:
+    from entity import Entity
+    from entity_list import EntityList
+    from game_map import GameMap
+
+
+# Monsters won't follow paths this long or longer, see Entity.move_astar()
+MAX_PATH_LENGTH = 25
+
+
+class PathCache(Slotted):
+    """The rest of the last path an entity computed, for reuse next turn.
+
+    The path stays good until the target moves away from its end, the next
+    step gets blocked, the map changes, or the entity itself ends up
+    somewhere other than where the path left it.
+
+    The hits/misses class attributes count lookups for all entities.
+    """
+
+    __slots__ = ('steps', 'position', 'map_version')
+
+    hits = 0
+    misses = 0
+
+    def __init__(self) -> None:
+        self.steps: List[Tuple[int, int]] = []
+        self.position: Optional[Tuple[int, int]] = None
+        self.map_version = -1
+
+    def lookup(self, entity: 'Entity', target: 'Entity',
+               entities: 'EntityList',
+               game_map: 'GameMap') -> Optional[List[Tuple[int, int]]]:
+        """Return the cached path from entity to target, if still valid."""
+        if (self.steps
+                and self.map_version == game_map.version
+                and self.position == (entity.x, entity.y)
+                and self.steps[-1] == (target.x, target.y)
+                and not game_map.is_blocked(*self.steps[0])
+                and not entities.blocking_at(*self.steps[0])):
+            PathCache.hits += 1
+            return self.steps
+        PathCache.misses += 1
+        return None
+
+    def store(self, entity: 'Entity', steps: List[Tuple[int, int]],
+              game_map: 'GameMap') -> None:
+        """Remember the path (or what's left of it) from entity's position."""
+        self.steps = steps
+        self.position = (entity.x, entity.y)
+        self.map_version = game_map.version
+
+    @classmethod
+    def reset_stats(cls) -> None:
+        cls.hits = cls.misses = 0
+
+
+class PathGraph:
+    """Where monsters can walk, shared by all of them during an enemy turn.
+
+    Building this costs one copy of the map's walkable array plus one pass
+    over the entities.  After that each path search only has to temporarily
+    free the start and goal tiles, and monster moves update a couple of
+    cells (EntityList calls entity_moved() for us).
+
+    With use_flow_field=True monsters chasing the same target don't search
+    for paths at all: we compute one Dijkstra distance map from the target
+    (see flow_field()) and every monster just steps downhill.
+    """
+
+    # All the 8 directions in which you can take a step
+    directions = [
+        (-1, -1), (0, -1), (1, -1),
+        (-1, 0), (1, 0),
+        (-1, 1), (0, 1), (1, 1),
+    ]
+
+    def __init__(self, game_map: 'GameMap', entities: 'EntityList',
+                 use_flow_field: bool = False) -> None:
+        self.use_flow_field = use_flow_field
+        self.flow_goal: Optional[Tuple[int, int]] = None
+        self.distance: Optional[np.ndarray] = None
+        self.walkable = game_map.fov_map.walkable
+        # tcod.path wants movement costs, where 0 means "can't go there"
+        self.cost = self.walkable.astype(np.int8)
+        for entity in entities:
+            if entity.blocks:
+                self.cost[entity.x, entity.y] = 0
+        # The 1.41 is the normal diagonal cost of moving, it can be set as 0.0
+        # if diagonal moves are prohibited.  AStar doesn't make a copy of the
+        # cost array, so it sees all our later changes.
+        self.astar = tcod.path.AStar(self.cost, diagonal=1.41)
+
+    def entity_moved(self, entity: 'Entity', old_x: int, old_y: int) -> None:
+        if entity.blocks:
+            self.cost[old_x, old_y] = self.walkable[old_x, old_y]
+            self.cost[entity.x, entity.y] = 0
+
+    def find_path(self, start_x: int, start_y: int,
+                  goal_x: int, goal_y: int) -> List[Tuple[int, int]]:
+        """Find a path around walls and blocking entities.
+
+        The start and the goal themselves are always considered free (you
+        don't want a monster to be blocked by itself or by its target).
+
+        Returns a list of steps, not including the start.  The list is empty
+        if there's no path.
+        """
+        saved_start = self.cost[start_x, start_y]
+        saved_goal = self.cost[goal_x, goal_y]
+        self.cost[start_x, start_y] = self.walkable[start_x, start_y]
+        self.cost[goal_x, goal_y] = self.walkable[goal_x, goal_y]
+        try:
+            return self.astar.get_path(start_x, start_y, goal_x, goal_y)
+        finally:
+            self.cost[goal_x, goal_y] = saved_goal
+            self.cost[start_x, start_y] = saved_start
+
+    def flow_field(self, goal_x: int, goal_y: int) -> np.ndarray:
+        """Compute the number of steps from every tile to the goal.
+
+        Walls and blocking entities (as of when we built the graph, except
+        for the goal itself) are in the way.  Unreachable tiles get the
+        maximum int32 value.
+
+        The result is cached, so all the monsters chasing the same target
+        during a turn share one computation.
+        """
+        if self.distance is None or self.flow_goal != (goal_x, goal_y):
+            saved_goal = self.cost[goal_x, goal_y]
+            self.cost[goal_x, goal_y] = self.walkable[goal_x, goal_y]
+            self.distance = tcod.path.maxarray(
+                self.cost.shape, dtype=np.int32, order='F')
+            self.distance[goal_x, goal_y] = 0
+            # Every step costs 1, even diagonal ones, so the distances are
+            # counted in steps, same as the length of a path
+            tcod.path.dijkstra2d(self.distance, self.cost, 1, 1)
+            self.cost[goal_x, goal_y] = saved_goal
+            self.flow_goal = (goal_x, goal_y)
+        return self.distance
+
+    def flow_step(self, start_x: int, start_y: int, goal_x: int, goal_y: int,
+                  max_steps: int) -> Optional[Tuple[int, int]]:
+        """Find the next step towards the goal, downhill in the flow field.
+
+        Returns None if the goal is unreachable, or if there's no free tile
+        next to the start from which the goal is less than max_steps away.
+        """
+        distance = self.flow_field(goal_x, goal_y)
+        width, height = distance.shape
+        best: Optional[Tuple[int, int]] = None
+        best_key: Tuple[int, int] = (max_steps, 0)
+        for dx, dy in self.directions:
+            x = start_x + dx
+            y = start_y + dy
+            # The flow field is from the start of the turn, but self.cost
+            # knows where everyone else has moved since then
+            if 0 <= x < width and 0 <= y < height and self.cost[x, y]:
+                # Prefer fewer steps, and then the straightest line
+                key = (int(distance[x, y]) + 1,
+                       (goal_x - x) ** 2 + (goal_y - y) ** 2)
+                if key < best_key:
+                    best = (x, y)
+                    best_key = key
+        return best
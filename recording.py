@@ -0,0 +1,103 @@
+import hashlib
+import json
+from typing import (
+    TYPE_CHECKING, Any, Dict, List, NamedTuple, Optional, TextIO, Tuple,
+)
+
+import tcod
+
+from game_types import UserAction
+from save_format import snapshot_to_bytes, take_snapshot
+
+if TYPE_CHECKING:
+    from game import Game
+
+
+# Bump this if the file format changes
+RECORDING_VERSION = 1
+
+
+def state_digest(game: 'Game') -> str:
+    """Return a hash of everything that would go into a save file.
+
+    If two games have the same digest, they're in the same state: same
+    dungeon, same monsters with the same HP in the same places, same
+    messages, same state of the random number generator.
+    """
+    document, tiles = take_snapshot(game.player, game.entities,
+                                    game.game_map, game.message_log,
+                                    game.game_state)
+    # How we keep the entities in memory doesn't change the game.  (The
+    # documents of the other floors are shared with the game, so we copy
+    # them rather than change them.)
+    del document['columnar']
+    document['floors']['levels'] = [
+        [level, {key: value for key, value in floor.items()
+                 if key != 'columnar'}]
+        for level, floor in document['floors']['levels']]
+    data = snapshot_to_bytes((document, tiles), compression='none')
+    return hashlib.sha256(data).hexdigest()
+
+
+class Recorder:
+    """Writes down a whole game, so we can play it again exactly.
+
+    A game is fully determined by the seed we give to the random module
+    before making the first map, and by what the player does.  So that's
+    what we write, one JSON object per line: first the seed, then each
+    action with where the mouse was (it matters for what we draw), and at
+    the end a digest of the final state, so whoever replays the game can
+    check they got the same result (see replay.py).
+
+    Like the Journal, we flush after every action, so if the game crashes
+    you still get a recording of everything up to the crash (just without
+    the final digest).
+    """
+
+    def __init__(self, filename: str, seed: int) -> None:
+        self.file: Optional[TextIO] = open(filename, 'w')
+        self.actions = 0
+        self.write({'version': RECORDING_VERSION, 'seed': seed})
+
+    def write(self, entry: Dict[str, Any]) -> None:
+        if self.file is not None:
+            self.file.write(json.dumps(entry) + '\n')
+            self.file.flush()
+
+    def record(self, action: UserAction, mouse: tcod.event.Point) -> None:
+        self.actions += 1
+        self.write({'action': action, 'mouse': [mouse.x, mouse.y]})
+
+    def finish(self, game: 'Game') -> None:
+        """Write down how the game ended, and stop recording."""
+        self.write({'actions': self.actions, 'digest': state_digest(game)})
+        self.close()
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class Recording(NamedTuple):
+    seed: int
+    # What the player did, and where the mouse was when they did it
+    actions: List[Tuple[UserAction, tcod.event.Point]]
+    # None if the game didn't end properly
+    digest: Optional[str]
+
+
+def read_recording(filename: str) -> Recording:
+    with open(filename) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    if not entries or entries[0].get('version') != RECORDING_VERSION:
+        raise ValueError(f'{filename} is not a recording we can play')
+    actions = []
+    digest = None
+    for entry in entries[1:]:
+        if 'action' in entry:
+            actions.append((entry['action'],
+                            tcod.event.Point(*entry['mouse'])))
+        elif 'digest' in entry:
+            digest = entry['digest']
+    return Recording(entries[0]['seed'], actions, digest)
@@ -1,5 +1,7 @@
 from typing import Tuple
 
+Area = Tuple[slice, slice]
+
 
 class Rect:
 
@@ -18,3 +20,20 @@ class Rect:
         """Return True if this rectangle intersects with another one."""
         return (self.x1 <= other.x2 and self.x2 >= other.x1 and
                 self.y1 <= other.y2 and self.y2 >= other.y1)
+
+    def inner(self) -> Area:
+        """The inside of the rectangle, for indexing [x, y] arrays.
+
+        This excludes the walls, i.e. the outermost row/column on every side.
+        """
+        return (slice(self.x1 + 1, self.x2), slice(self.y1 + 1, self.y2))
+
+
+def h_tunnel(x1: int, x2: int, y: int) -> Area:
+    """A horizontal tunnel from x1 to x2 (inclusive), for indexing arrays."""
+    return (slice(min(x1, x2), max(x1, x2) + 1), slice(y, y + 1))
+
+
+def v_tunnel(y1: int, y2: int, x: int) -> Area:
+    """A vertical tunnel from y1 to y2 (inclusive), for indexing arrays."""
+    return (slice(x, x + 1), slice(min(y1, y2), max(y1, y2) + 1))
@@ -1,8 +1,8 @@
 import enum
-import math
 from operator import attrgetter
-from typing import TYPE_CHECKING, Dict, List
+from typing import TYPE_CHECKING, Dict, Optional, Set, Tuple
 
+import numpy as np
 import tcod
 import tcod.event
 
@@ -14,6 +14,8 @@ from menus import character_screen, inventory_menu, level_up_menu
 if TYPE_CHECKING:
     from game_map import GameMap
     from entity import Entity
+    from entity_list import EntityList
+    from frame_timer import FrameTimer
 
 
 class RenderOrder(enum.Enum):
@@ -23,15 +25,73 @@ class RenderOrder(enum.Enum):
     ACTOR = enum.auto()
 
 
-def get_names_under_mouse(mouse: tcod.event.Point, entities: List['Entity'],
+class RenderLayers(enum.Flag):
+    NONE = 0
+    MAP = enum.auto()       # tile colors (FOV changes, targeting)
+    ENTITIES = enum.auto()  # all entity glyphs
+    PANEL = enum.auto()     # HP/XP bars, messages, names under the mouse
+    ALL = MAP | ENTITIES | PANEL
+
+
+# Game states that draw a menu window on top of everything else
+MENU_STATES = (
+    GameStates.SHOW_INVENTORY,
+    GameStates.DROP_INVENTORY,
+    GameStates.LEVEL_UP,
+    GameStates.CHARACTER_SCREEN,
+)
+
+
+class DirtyTracker:
+    """Keeps track of what changed since the last frame.
+
+    Mark whole layers with mark(), or individual map cells whose entities
+    changed with mark_cell()/mark_entity().  render_all() redraws and blits
+    only what was marked, and then forgets about it.
+    """
+
+    def __init__(self) -> None:
+        self.layers = RenderLayers.ALL
+        self.cells: Set[Tuple[int, int]] = set()
+        # What the last frame was drawn for
+        self.game_state: Optional[GameStates] = None
+        self.mouse: Optional[Tuple[int, int]] = None
+
+    def __bool__(self) -> bool:
+        return bool(self.layers or self.cells)
+
+    def mark(self, layers: RenderLayers) -> None:
+        self.layers |= layers
+
+    def mark_all(self) -> None:
+        self.layers = RenderLayers.ALL
+
+    def mark_cell(self, x: int, y: int) -> None:
+        self.cells.add((x, y))
+
+    def mark_entity(self, entity: 'Entity') -> None:
+        self.cells.add((entity.x, entity.y))
+
+    def entity_moved(self, entity: 'Entity', old_x: int, old_y: int) -> None:
+        # Add the DirtyTracker to EntityList.watchers to have this called
+        # automatically
+        self.cells.add((old_x, old_y))
+        self.cells.add((entity.x, entity.y))
+
+    def clean(self) -> None:
+        self.layers = RenderLayers.NONE
+        self.cells.clear()
+
+
+def get_names_under_mouse(mouse: tcod.event.Point, entities: 'EntityList',
                           fov_map: tcod.map.Map) -> str:
     (x, y) = (mouse.x, mouse.y)
 
-    names = [
-        entity.name
-        for entity in entities
-        if (x, y) == (entity.x, entity.y) and fov_map.fov[x, y]
-    ]
+    if not (0 <= x < fov_map.width and 0 <= y < fov_map.height
+            and fov_map.fov[x, y]):
+        return ''
+
+    names = [entity.name for entity in entities.at(x, y)]
     return ', '.join(names).capitalize()
 
 
@@ -55,44 +115,111 @@ def render_bar(panel: tcod.console.Console, x: int, y: int, total_width: int,
 
 def render_all(
     root_console: tcod.console.Console, con: tcod.console.Console,
-    panel: tcod.console.Console, entities: List['Entity'], player: 'Entity',
+    panel: tcod.console.Console, entities: 'EntityList', player: 'Entity',
     game_map: 'GameMap', fov_map: tcod.map.Map, fov_recompute: bool,
     message_log: MessageLog, screen_width: int, screen_height: int,
     bar_width: int, panel_height: int, panel_y: int, mouse: tcod.event.Point,
     colors: Dict[str, tcod.Color], game_state: GameStates,
-    target_radius: int = 0,
-) -> None:
-    # Draw all the tiles in the game map
-    for y in range(game_map.height):
-        for x in range(game_map.width):
-            visible = fov_map.fov[x, y]
-            wall = game_map.tiles[x][y].block_sight
-            if visible:
-                if wall:
-                    color = colors['light_wall']
-                else:
-                    if (game_state == GameStates.TARGETING and
-                            math.hypot(x - mouse.x,
-                                       y - mouse.y) <= target_radius):
-                        color = colors['target_ground']
-                    else:
-                        color = colors['light_ground']
-                game_map.tiles[x][y].explored = True
-            elif game_map.tiles[x][y].explored:
-                if wall:
-                    color = colors['dark_wall']
-                else:
-                    color = colors['dark_ground']
-            else:
-                continue
-            con.bg[x, y] = cast_to_color(color)
-
-    # Draw all entities in the list
-    for entity in sorted(entities, key=attrgetter('render_order.value')):
-        draw_entity(con, entity, fov_map, game_map)
-
-    con.blit(root_console, 0, 0, 0, 0, screen_width, screen_height)
+    target_radius: int = 0, dirty: Optional[DirtyTracker] = None,
+) -> bool:
+    """Draw the game on the root console.
+
+    If you pass a DirtyTracker, only the parts marked in it get redrawn.
+    Returns True if anything was drawn at all (i.e. if it's worth calling
+    tcod.console_flush()).
+    """
+    if dirty is None:
+        # Nobody's tracking changes for us, so assume everything changed
+        dirty = DirtyTracker()
+
+    if fov_recompute:
+        dirty.mark(RenderLayers.MAP)
+
+    if (mouse.x, mouse.y) != dirty.mouse:
+        dirty.mouse = (mouse.x, mouse.y)
+        # The names under the mouse are shown in the panel
+        dirty.mark(RenderLayers.PANEL)
+        if game_state == GameStates.TARGETING:
+            dirty.mark(RenderLayers.MAP)
+
+    if game_state != dirty.game_state:
+        # A menu appeared or went away
+        dirty.game_state = game_state
+        dirty.mark_all()
+    elif dirty and game_state in MENU_STATES:
+        # Menus are drawn semi-transparently over whatever is on the root
+        # console, so if we redraw the menu we must redraw what's under it
+        dirty.mark_all()
+
+    if not dirty:
+        return False
+
+    if dirty.layers & RenderLayers.MAP:
+        # Draw all the tiles in the game map, all at once
+        render_tiles(con, game_map, fov_map, mouse, colors, game_state,
+                     target_radius)
+
+    if dirty.layers & (RenderLayers.MAP | RenderLayers.ENTITIES):
+        # FOV changes can reveal or hide any entity, so draw them all
+        con.ch[:game_map.width, :game_map.height] = ord(' ')
+        for entity in entities.in_render_order():
+            draw_entity(con, entity, fov_map, game_map)
+
+        con.blit(root_console, 0, 0, 0, 0, screen_width, screen_height)
+    elif dirty.cells:
+        # Redraw only the cells where something moved, died, got picked up
+        # or dropped
+        for x, y in dirty.cells:
+            con.ch[x, y] = ord(' ')
+        changed = [
+            entity
+            for x, y in dirty.cells
+            for entity in entities.at(x, y)
+        ]
+        for entity in sorted(changed, key=attrgetter('render_order.value')):
+            draw_entity(con, entity, fov_map, game_map)
+
+        x1 = min(x for x, y in dirty.cells)
+        y1 = min(y for x, y in dirty.cells)
+        x2 = max(x for x, y in dirty.cells)
+        y2 = max(y for x, y in dirty.cells)
+        con.blit(root_console, x1, y1, x1, y1, x2 - x1 + 1, y2 - y1 + 1)
+
+    if dirty.layers & RenderLayers.PANEL:
+        render_panel(panel, entities, player, game_map, fov_map, message_log,
+                     bar_width, mouse)
+        panel.blit(root_console, 0, panel_y, 0, 0, screen_width,
+                   panel_height)
+
+    dirty.clean()
+
+    if game_state == GameStates.SHOW_INVENTORY:
+        inventory_menu(
+            root_console,
+            "Press the key next to an item to use it, or Esc to cancel.\n",
+            player, 50, screen_width, screen_height,
+        )
+    elif game_state == GameStates.DROP_INVENTORY:
+        inventory_menu(
+            root_console,
+            "Press the key next to an item to drop it, or Esc to cancel.\n",
+            player, 50, screen_width, screen_height,
+        )
+    elif game_state == GameStates.LEVEL_UP:
+        level_up_menu(root_console, 'Level up! Choose a stat to raise:',
+                      player, 40, screen_width, screen_height)
+    elif game_state == GameStates.CHARACTER_SCREEN:
+        character_screen(root_console, player, 30, 10,
+                         screen_width, screen_height)
+
+    return True
 
+
+def render_panel(
+    panel: tcod.console.Console, entities: 'EntityList', player: 'Entity',
+    game_map: 'GameMap', fov_map: tcod.map.Map, message_log: MessageLog,
+    bar_width: int, mouse: tcod.event.Point,
+) -> None:
     panel.clear(bg=cast_to_color(tcod.black))
 
     # Print the game messages, one line at a time
@@ -125,29 +252,74 @@ def render_all(
                 bg_blend=tcod.BKGND_NONE,
                 alignment=tcod.LEFT)
 
-    panel.blit(root_console, 0, panel_y, 0, 0, screen_width, panel_height)
 
-    if game_state == GameStates.SHOW_INVENTORY:
-        inventory_menu(
-            root_console,
-            "Press the key next to an item to use it, or Esc to cancel.\n",
-            player, 50, screen_width, screen_height,
-        )
-    elif game_state == GameStates.DROP_INVENTORY:
-        inventory_menu(
-            root_console,
-            "Press the key next to an item to drop it, or Esc to cancel.\n",
-            player, 50, screen_width, screen_height,
-        )
-    elif game_state == GameStates.LEVEL_UP:
-        level_up_menu(root_console, 'Level up! Choose a stat to raise:',
-                      player, 40, screen_width, screen_height)
-    elif game_state == GameStates.CHARACTER_SCREEN:
-        character_screen(root_console, player, 30, 10,
-                         screen_width, screen_height)
+# The phases render_frame_times() shows; input and whole frames are left
+# out, because they're mostly waiting for the player
+OVERLAY_PHASES = ['fov', 'render', 'flush', 'player', 'enemies', 'save']
+OVERLAY_WIDTH = 29
+
+
+def render_frame_times(console: tcod.console.Console, timer: 'FrameTimer',
+                       x: int, y: int) -> None:
+    """Show how long the phases of recent frames took, in milliseconds."""
+    lines = [f'{"ms":<8}{"p50":>7}{"p95":>7}{"max":>7}']
+    for phase in OVERLAY_PHASES:
+        stats = timer.phases[phase].summary()
+        if stats['count']:
+            lines.append(f'{phase:<8}{stats["p50_ms"]:7.2f}'
+                         f'{stats["p95_ms"]:7.2f}{stats["max_ms"]:7.2f}')
+        else:
+            lines.append(f'{phase:<8}{"-":>7}{"-":>7}{"-":>7}')
+    for dy, line in enumerate(lines):
+        console.print(x, y + dy, line.ljust(OVERLAY_WIDTH),
+                      fg=cast_to_color(tcod.light_gray),
+                      bg=cast_to_color(tcod.black),
+                      alignment=tcod.LEFT)
+
+
+def render_tiles(
+    con: tcod.console.Console, game_map: 'GameMap', fov_map: tcod.map.Map,
+    mouse: tcod.event.Point, colors: Dict[str, tcod.Color],
+    game_state: GameStates, target_radius: int = 0,
+) -> None:
+    visible = fov_map.fov
+    explored = game_map.explored
+    wall = game_map.block_sight
+
+    if game_state == GameStates.TARGETING:
+        # Squared distances from the mouse, i.e. math.hypot() without the
+        # square root, for every tile at once
+        xs, ys = np.ogrid[:game_map.width, :game_map.height]
+        targeted = ((xs - mouse.x) ** 2 + (ys - mouse.y) ** 2
+                    <= target_radius ** 2)
+    else:
+        targeted = False
+
+    bg = con.bg[:game_map.width, :game_map.height]
+    # np.select() picks the first matching choice, so the order matters.
+    # Tiles that are neither visible nor explored keep their old color.
+    conditions = [
+        visible & wall,
+        visible & targeted,
+        visible,
+        explored & wall,
+        explored,
+    ]
+    choices = [
+        colors['light_wall'],
+        colors['target_ground'],
+        colors['light_ground'],
+        colors['dark_wall'],
+        colors['dark_ground'],
+    ]
+    bg[...] = np.select(
+        [condition[..., np.newaxis] for condition in conditions],
+        [np.asarray(color, dtype=bg.dtype) for color in choices],
+        bg,
+    )
 
 
-def clear_all(con: tcod.console.Console, entities: List['Entity']) -> None:
+def clear_all(con: tcod.console.Console, entities: 'EntityList') -> None:
     for entity in entities:
         clear_entity(con, entity)
 
@@ -155,7 +327,7 @@ def clear_all(con: tcod.console.Console, entities: List['Entity']) -> None:
 def draw_entity(con: tcod.console.Console, entity: 'Entity',
                 fov_map: tcod.map.Map, game_map: 'GameMap') -> None:
     if (fov_map.fov[entity.x, entity.y] or
-            entity.stairs and game_map.tiles[entity.x][entity.y].explored):
+            entity.stairs and game_map.explored[entity.x, entity.y]):
         con.ch[entity.x, entity.y] = ord(entity.char)
         con.fg[entity.x, entity.y] = cast_to_color(entity.color)
 
@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+"""Play a recorded game again, as fast as we can, and check it ends the same.
+
+Usage: python3 replay.py [--no-render] [--repeat N] [--columnar]
+                         [--profile FILE] RECORDING
+
+Record a game with "engine --record RECORDING".  We replay it through the
+same steps as the game loop in engine.py: recompute the FOV, draw
+everything (to consoles in memory, there's no window), and let the Game
+take the player's action.  We skip the waiting for input and the
+flushing to the screen.  With --no-render we don't draw either, which
+leaves just the rules of the game.
+
+At the end we compare the state of the game with the one in the
+recording, and exit with an error if they're different: a replay that
+doesn't end the same way didn't do the same work, so its timings mean
+nothing.  We print how long each phase took, as engine --profile would.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import tcod
+import tcod.console
+
+from frame_timer import PHASES, FrameTimer
+from game import Game
+from initialize_new_game import constants, get_game_variables
+from recording import Recording, read_recording, state_digest
+from render_functions import render_all
+
+
+def replay(recording: Recording, render: bool, timer: FrameTimer) -> str:
+    """Play the recorded game, and return the digest of its final state."""
+    random.seed(recording.seed)
+    game = Game(*get_game_variables(), timer=timer)
+
+    root_console = tcod.console.Console(
+        constants.screen_width, constants.screen_height, order='F')
+    con = tcod.console.Console(
+        constants.screen_width, constants.screen_height, order='F')
+    panel = tcod.console.Console(
+        constants.screen_width, constants.panel_height, order='F')
+
+    for action, mouse in recording.actions:
+        timer.start_frame()
+
+        fov_recompute = game.update_fov()
+        timer.lap('fov')
+
+        if render:
+            render_all(
+                root_console,
+                con, panel, game.entities, game.player, game.game_map,
+                game.fov_map, fov_recompute, game.message_log,
+                constants.screen_width, constants.screen_height,
+                constants.bar_width, constants.panel_height,
+                constants.panel_y, mouse, constants.colors,
+                game.game_state, game.target_radius, game.dirty,
+            )
+            timer.lap('render')
+
+        results = game.step(action)
+        if any(result.get('new_floor') for result in results):
+            con.clear()
+        if any(result.get('exit') for result in results):
+            break
+
+    timer.end_frame()
+    game.close()
+    return state_digest(game)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Play a recorded game again, as fast as we can.')
+    parser.add_argument('recording', metavar='RECORDING',
+                        help='a file written by engine --record')
+    parser.add_argument('--no-render', dest='render', action='store_false',
+                        help="don't draw anything")
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='replay it this many times'
+                             ' (default: %(default)s)')
+    parser.add_argument('--columnar', action='store_true',
+                        help='keep entities in NumPy columns')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='write the frame times to FILE as JSON')
+    args = parser.parse_args()
+
+    recording = read_recording(args.recording)
+    profile = args.profile and os.path.abspath(args.profile)
+    constants.columnar_entities = args.columnar
+
+    timer = FrameTimer()
+    clock = time.perf_counter
+    ok = True
+    # Floors we leave get written to the current directory, so go
+    # somewhere they won't clobber a real saved game
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='replay-') as tmpdir:
+        os.chdir(tmpdir)
+        try:
+            for n in range(args.repeat):
+                start = clock()
+                digest = replay(recording, args.render, timer)
+                seconds = clock() - start
+                actions = len(recording.actions)
+                print(f'{actions} actions in {seconds:.2f} s:'
+                      f' {actions / (seconds or 1e-9):.0f} actions/s')
+                if recording.digest is None:
+                    print('The recording has no final state to check'
+                          ' against')
+                elif digest != recording.digest:
+                    print('The final state is different from the recorded'
+                          ' one!')
+                    ok = False
+                else:
+                    print('The final state matches the recorded one')
+        finally:
+            os.chdir(cwd)
+
+    summary = timer.summary()
+    print(f'{"phase":<8} {"count":>7} {"p50 ms":>8} {"p95 ms":>8}'
+          f' {"max ms":>8}')
+    for phase in PHASES + ['frame']:
+        stats = summary[phase]
+        if stats['count']:
+            print(f'{phase:<8} {stats["count"]:7} {stats["p50_ms"]:8.3f}'
+                  f' {stats["p95_ms"]:8.3f} {stats["max_ms"]:8.3f}')
+    if profile:
+        timer.dump(profile)
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
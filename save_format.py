@@ -0,0 +1,481 @@
+"""Our own save file format.
+
+A save file is a short header followed by a payload, which may be
+compressed:
+
+    header:  b'TTSV', format version (uint16), compression (uint8)
+    payload: length of the JSON document (uint32), the JSON document,
+             then the tile layers of the map as packed bit arrays
+
+The JSON document describes everything else, in a way that doesn't
+depend on how our classes look in memory:
+
+- colors are indices into a palette of (r, g, b) triples
+- entities are lists of fields, and their components are indices into
+  one table per component type
+- entities refer to each other (e.g. inventory items) by index too
+- the state of the random number generator and how far the turn journal
+  got are in there too, so we can replay the journal on top of a save
+- the other floors the player has been on have their own documents, with
+  their own palettes and entity tables; their tile layers follow those of
+  the current floor
+
+When the format changes, bump SAVE_VERSION and add a function to
+MIGRATIONS that upgrades a document from the previous version.
+"""
+import json
+import lzma
+import random
+import struct
+import zlib
+from typing import (
+    TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Tuple,
+)
+
+import numpy as np
+import tcod
+
+import item_functions
+from ai import AIComponent, BasicMonster, ConfusedMonster
+from entity import Entity
+from entity_list import EntityList
+from equipment import Equipment
+from equipment_slots import EquipmentSlots
+from equippable import Equippable
+from fighter import Fighter
+from floor_store import Floor, FloorStore
+from game_map import GameMap
+from game_messages import Message, MessageLog
+from game_states import GameStates
+from inventory import Inventory
+from item import Item
+from journal import Journal
+from level import Level
+from render_functions import RenderOrder
+from stairs import Stairs
+
+if TYPE_CHECKING:
+    from components import Component
+
+
+MAGIC = b'TTSV'
+SAVE_VERSION = 3
+
+HEADER = struct.Struct('<4sHB')
+LENGTH = struct.Struct('<I')
+
+COMPRESSIONS = ['none', 'zlib', 'lzma']
+
+TILE_LAYERS = ['blocked', 'block_sight', 'explored']
+
+Document = Dict[str, Any]
+# The JSON document and the packed tile layers
+Snapshot = Tuple[Document, bytes]
+GameData = Tuple[Entity, EntityList, GameMap, MessageLog, GameStates]
+
+# MIGRATIONS[n] converts a version n document into a version n + 1 one
+MIGRATIONS: Dict[int, Callable[[Document], Document]] = {}
+
+
+def migrate_v1(document: Document) -> Document:
+    # No random state or journal, and BasicMonster records have no path
+    # cache (decode_ai() copes with that)
+    document['rng'] = None
+    document['journal'] = None
+    document['map']['version'] = 0
+    return document
+
+
+MIGRATIONS[1] = migrate_v1
+
+
+def migrate_v2(document: Document) -> Document:
+    # We didn't keep the other floors
+    document['floors'] = {'cache_size': 3, 'levels': []}
+    return document
+
+
+MIGRATIONS[2] = migrate_v2
+
+
+def save_to_bytes(player: Entity, entities: EntityList, game_map: GameMap,
+                  message_log: MessageLog, game_state: GameStates,
+                  compression: str = 'zlib',
+                  journal: Optional[Journal] = None) -> bytes:
+    snapshot = take_snapshot(player, entities, game_map, message_log,
+                             game_state, journal)
+    return snapshot_to_bytes(snapshot, compression)
+
+
+def take_snapshot(player: Entity, entities: EntityList, game_map: GameMap,
+                  message_log: MessageLog, game_state: GameStates,
+                  journal: Optional[Journal] = None) -> Snapshot:
+    """Copy everything we need to save out of the game objects.
+
+    This is the quick part of saving.  The snapshot shares nothing mutable
+    with the game, so you can pass it to snapshot_to_bytes() in another
+    thread while the game goes on.  (It does share the documents of the
+    other floors with game_map.floors, but nobody changes those.)
+
+    The other floors get encoded only once after the player leaves them,
+    so saving doesn't get slower the more floors the player has seen.
+    """
+    document = Encoder().encode(player, entities, game_map, message_log,
+                                game_state, journal)
+    tiles = [pack_tiles(getattr(game_map, name) for name in TILE_LAYERS)]
+    floors = game_map.floors
+    levels = []
+    for level in floors.levels():
+        if level not in floors.snapshots:
+            floor = floors.get(level)
+            floors.snapshots[level] = (
+                Encoder().encode_floor(floor.entities),
+                pack_tiles(floor.tiles))
+        floor_document, floor_tiles = floors.snapshots[level]
+        levels.append([level, floor_document])
+        tiles.append(floor_tiles)
+    document['floors'] = {
+        'cache_size': floors.cache_size,
+        'levels': levels,
+    }
+    return document, b''.join(tiles)
+
+
+def pack_tiles(layers: Iterable[np.ndarray]) -> bytes:
+    """Pack tile layers into bits, one layer after another."""
+    return b''.join(
+        np.packbits(layer.ravel(order='F')).tobytes() for layer in layers)
+
+
+def snapshot_to_bytes(snapshot: Snapshot, compression: str = 'zlib') -> bytes:
+    document, tiles = snapshot
+    json_bytes = json.dumps(document, separators=(',', ':')).encode()
+    payload = b''.join([LENGTH.pack(len(json_bytes)), json_bytes, tiles])
+    if compression == 'zlib':
+        payload = zlib.compress(payload)
+    elif compression == 'lzma':
+        payload = lzma.compress(payload)
+    header = HEADER.pack(MAGIC, SAVE_VERSION,
+                         COMPRESSIONS.index(compression))
+    return header + payload
+
+
+def load_from_bytes(data: bytes) -> Tuple[GameData, Optional[Journal]]:
+    """Load a game.
+
+    Also returns a Journal that continues where the one the game was saved
+    with left off, or None if it was saved without one.
+    """
+    magic, version, compression = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('not a save file')
+    if version > SAVE_VERSION:
+        raise ValueError(f'save file version {version} is too new')
+    payload = data[HEADER.size:]
+    if COMPRESSIONS[compression] == 'zlib':
+        payload = zlib.decompress(payload)
+    elif COMPRESSIONS[compression] == 'lzma':
+        payload = lzma.decompress(payload)
+
+    (json_length,) = LENGTH.unpack_from(payload)
+    start = LENGTH.size + json_length
+    document = json.loads(payload[LENGTH.size:start])
+    while version < SAVE_VERSION:
+        document = MIGRATIONS[version](document)
+        version += 1
+
+    width, height = document['map']['width'], document['map']['height']
+    layer_size = (width * height + 7) // 8
+
+    def next_layer() -> np.ndarray:
+        nonlocal start
+        bits = np.frombuffer(payload, dtype=np.uint8, count=layer_size,
+                             offset=start)
+        start += layer_size
+        return np.unpackbits(bits, count=width * height).astype(
+            bool).reshape((width, height), order='F')
+
+    layers = {name: next_layer() for name in TILE_LAYERS}
+    floor_tiles = [np.stack([next_layer() for name in TILE_LAYERS])
+                   for level in document['floors']['levels']]
+
+    return Decoder(document).decode(layers, floor_tiles)
+
+
+class Encoder:
+
+    def __init__(self) -> None:
+        self.palette: Dict[Tuple[int, int, int], int] = {}
+        self.entity_ids: Dict[Entity, int] = {}
+        self.entities: List[Entity] = []
+        self.tables: Dict[str, List[Any]] = {
+            name: [] for name in Entity.COMPONENTS
+        }
+
+    def color(self, color: tcod.Color) -> int:
+        r, g, b = color
+        return self.palette.setdefault((r, g, b), len(self.palette))
+
+    def message(self, message: Message) -> List[Any]:
+        return [message.text, self.color(message.color)]
+
+    def entity(self, entity: Entity) -> int:
+        """Return the index of the entity, giving it one if needed."""
+        if entity not in self.entity_ids:
+            self.entity_ids[entity] = len(self.entities)
+            self.entities.append(entity)
+        return self.entity_ids[entity]
+
+    def encode(self, player: Entity, entities: EntityList, game_map: GameMap,
+               message_log: MessageLog, game_state: GameStates,
+               journal: Optional[Journal] = None) -> Document:
+        document = self.encode_entities(entities)
+        version, internal_state, gauss_next = random.getstate()
+        return {
+            **document,
+            'game_state': game_state.name,
+            'rng': [version, list(internal_state), gauss_next],
+            'journal': {
+                'actions': journal.action_count,
+                'turns': journal.turn,
+            } if journal is not None else None,
+            'player': self.entity_ids[player],
+            'map': {
+                'width': game_map.width,
+                'height': game_map.height,
+                'dungeon_level': game_map.dungeon_level,
+                'version': game_map.version,
+            },
+            'message_log': {
+                'x': message_log.x,
+                'width': message_log.width,
+                'height': message_log.height,
+                'history_size': message_log.history.maxlen,
+                'spill_file': message_log.spill_file,
+                'messages': [self.message(message)
+                             for message in message_log.messages],
+                'history': [self.message(message)
+                            for message in message_log.history],
+            },
+            # Last, because all of the above add to the palette
+            'palette': list(self.palette),
+        }
+
+    def encode_floor(self, entities: EntityList) -> Document:
+        """Encode a floor the player isn't on (the tiles go separately)."""
+        document = self.encode_entities(entities)
+        document['palette'] = list(self.palette)
+        return document
+
+    def encode_entities(self, entities: EntityList) -> Document:
+        entity_list = [self.entity(entity) for entity in entities]
+        # Encoding an entity can give indices to more entities (e.g. the
+        # items in an inventory), so keep going until we've done them all
+        records: List[List[Any]] = []
+        while len(records) < len(self.entities):
+            records.append(self.encode_entity(self.entities[len(records)]))
+        return {
+            'entity_list': entity_list,
+            'columnar': entities.columns is not None,
+            'entities': records,
+            'components': self.tables,
+        }
+
+    def encode_entity(self, entity: Entity) -> List[Any]:
+        return [
+            entity.x, entity.y, entity.char, self.color(entity.color),
+            entity.name, entity.blocks, entity.render_order.name,
+        ] + [
+            self.component(name, getattr(entity, name))
+            for name in Entity.COMPONENTS
+        ]
+
+    def component(self, name: str,
+                  component: Optional['Component']) -> Optional[int]:
+        if component is None:
+            return None
+        record = getattr(self, 'encode_' + name)(component)
+        table = self.tables[name]
+        table.append(record)
+        return len(table) - 1
+
+    def encode_fighter(self, fighter: Fighter) -> List[Any]:
+        return [fighter.hp, fighter.base_max_hp, fighter.base_power,
+                fighter.base_defense, fighter.xp]
+
+    def encode_ai(self, ai: AIComponent) -> List[Any]:
+        if isinstance(ai, ConfusedMonster):
+            # The previous AI goes into the table first
+            return ['ConfusedMonster', self.component('ai', ai.previous_ai),
+                    ai.number_of_turns]
+        if isinstance(ai, BasicMonster):
+            # Replaying the journal has to follow the same paths as the
+            # original game, so keep the cached ones
+            cache = ai.path_cache
+            return ['BasicMonster', cache.steps, cache.position,
+                    cache.map_version]
+        return [type(ai).__name__]
+
+    def encode_item(self, item: Item) -> List[Any]:
+        return [
+            item.use_function.__name__ if item.use_function else None,
+            item.targeting,
+            self.message(item.targeting_message)
+            if item.targeting_message else None,
+            dict(item.function_kwargs),
+        ]
+
+    def encode_inventory(self, inventory: Inventory) -> List[Any]:
+        return [inventory.capacity,
+                [self.entity(item) for item in inventory.items]]
+
+    def encode_stairs(self, stairs: Stairs) -> List[Any]:
+        return [stairs.floor]
+
+    def encode_level(self, level: Level) -> List[Any]:
+        return [level.current_level, level.current_xp, level.level_up_base,
+                level.level_up_factor]
+
+    def encode_equipment(self, equipment: Equipment) -> List[Any]:
+        return [[slot.name, self.entity(item)]
+                for slot, item in equipment.slots.items()
+                if item is not None]
+
+    def encode_equippable(self, equippable: Equippable) -> List[Any]:
+        return [equippable.slot.name, equippable.power_bonus,
+                equippable.defense_bonus, equippable.max_hp_bonus]
+
+
+class Decoder:
+
+    def __init__(self, document: Document) -> None:
+        self.document = document
+        self.palette = [tcod.Color(r, g, b)
+                        for r, g, b in document['palette']]
+        self.entities: List[Entity] = []
+
+    def message(self, record: List[Any]) -> Message:
+        text, color = record
+        return Message(text, self.palette[color])
+
+    def decode(self, layers: Dict[str, np.ndarray],
+               floor_tiles: List[np.ndarray],
+               ) -> Tuple[GameData, Optional[Journal]]:
+        document = self.document
+        entities = self.decode_entities()
+
+        map_info = document['map']
+        floors_info = document['floors']
+        game_map = GameMap(map_info['width'], map_info['height'],
+                           map_info['dungeon_level'],
+                           FloorStore(floors_info['cache_size']))
+        for name, layer in layers.items():
+            getattr(game_map, name)[...] = layer
+        game_map.sync_fov_map()
+        # After sync_fov_map(), which bumps it
+        game_map.version = map_info['version']
+        for (level, floor_document), tiles in zip(floors_info['levels'],
+                                                  floor_tiles):
+            floor_entities = Decoder(floor_document).decode_entities()
+            game_map.floors.put(level, Floor(floor_entities, tiles))
+            # We already have what the next save needs
+            game_map.floors.snapshots[level] = (floor_document,
+                                                pack_tiles(tiles))
+
+        log_info = document['message_log']
+        message_log = MessageLog(log_info['x'], log_info['width'],
+                                 log_info['height'], log_info['history_size'],
+                                 log_info['spill_file'])
+        message_log.messages.extend(
+            self.message(record) for record in log_info['messages'])
+        message_log.history.extend(
+            self.message(record) for record in log_info['history'])
+
+        if document['rng'] is not None:
+            version, internal_state, gauss_next = document['rng']
+            random.setstate((version, tuple(internal_state), gauss_next))
+
+        journal = None
+        if document['journal'] is not None:
+            journal = Journal(document['journal']['actions'],
+                              document['journal']['turns'])
+
+        player = self.entities[document['player']]
+        game_state = GameStates[document['game_state']]
+        return (player, entities, game_map, message_log, game_state), journal
+
+    def decode_entities(self) -> EntityList:
+        document = self.document
+        # Create all the entities first, so components can refer to them
+        for x, y, char, color, name, blocks, render_order, *_ in (
+                document['entities']):
+            self.entities.append(Entity(
+                x, y, char, self.palette[color], name, blocks,
+                RenderOrder[render_order]))
+        for entity, record in zip(self.entities, document['entities']):
+            for name, index in zip(Entity.COMPONENTS, record[7:]):
+                if index is not None:
+                    setattr(entity, name, self.component(name, index))
+
+        return EntityList(
+            (self.entities[index] for index in document['entity_list']),
+            columnar=document['columnar'])
+
+    def component(self, name: str, index: int) -> Any:
+        record = self.document['components'][name][index]
+        return getattr(self, 'decode_' + name)(record)
+
+    def decode_fighter(self, record: List[Any]) -> Fighter:
+        hp, base_max_hp, base_power, base_defense, xp = record
+        fighter = Fighter(base_max_hp, base_defense, base_power, xp)
+        fighter.hp = hp
+        return fighter
+
+    def decode_ai(self, record: List[Any]) -> AIComponent:
+        if record[0] == 'ConfusedMonster':
+            _, previous_ai, number_of_turns = record
+            return ConfusedMonster(self.component('ai', previous_ai),
+                                   number_of_turns)
+        assert record[0] == 'BasicMonster'
+        ai = BasicMonster()
+        if len(record) > 1:
+            _, steps, position, map_version = record
+            cache = ai.path_cache
+            cache.steps = [(x, y) for x, y in steps]
+            if position is not None:
+                cache.position = (position[0], position[1])
+            cache.map_version = map_version
+        return ai
+
+    def decode_item(self, record: List[Any]) -> Item:
+        use_function, targeting, targeting_message, kwargs = record
+        return Item(
+            getattr(item_functions, use_function) if use_function else None,
+            targeting,
+            self.message(targeting_message) if targeting_message else None,
+            **kwargs)
+
+    def decode_inventory(self, record: List[Any]) -> Inventory:
+        capacity, items = record
+        inventory = Inventory(capacity)
+        inventory.items = [self.entities[index] for index in items]
+        return inventory
+
+    def decode_stairs(self, record: List[Any]) -> Stairs:
+        return Stairs(*record)
+
+    def decode_level(self, record: List[Any]) -> Level:
+        return Level(*record)
+
+    def decode_equipment(self, record: List[Any]) -> Equipment:
+        equipment = Equipment()
+        for slot_name, index in record:
+            slot = EquipmentSlots[slot_name]
+            equipment.slots[slot] = self.entities[index]
+            equipment.equipped[self.entities[index]] = slot
+        return equipment
+
+    def decode_equippable(self, record: List[Any]) -> Equippable:
+        slot, power_bonus, defense_bonus, max_hp_bonus = record
+        return Equippable(EquipmentSlots[slot], power_bonus, defense_bonus,
+                          max_hp_bonus)
@@ -17,6 +17,7 @@ setup(
 
     py_modules=[
         "ai",
+        "column_store",
         "data_loaders",
         "death_functions",
         "components",
@@ -25,8 +26,12 @@ setup(
         "equippable",
         "engine",
         "entity",
+        "entity_list",
         "fighter",
+        "floor_store",
         "fov_functions",
+        "frame_timer",
+        "game",
         "game_map",
         "game_messages",
         "game_states",
@@ -36,14 +41,18 @@ setup(
         "inventory",
         "item",
         "item_functions",
+        "journal",
         "level",
         "map_objects",
         "menus",
+        "pathfinding",
         "random_utils",
+        "recording",
         "render_functions",
+        "save_format",
         "stairs",
     ],
-    install_requires=["tcod"],
+    install_requires=["numpy", "tcod"],
     entry_points={
         "console_scripts": [
             "engine = engine:main",
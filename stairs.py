@@ -1,4 +1,8 @@
-class Stairs:
+from components import Component
+
+
+class Stairs(Component):
+    __slots__ = ('floor',)
 
     def __init__(self, floor: int):
         self.floor = floor